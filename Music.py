@@ -1,15 +1,33 @@
 import asyncio
-import datetime
+import itertools
 import os
 import re
+import socket
 import sys
+import time
+import urllib.error
 
+import aiohttp
 import discord
 import youtube_dl
 from discord.ext import commands
 
 import bot_util as bt
+from admission import AdmissionController, AdmissionError
+from audio_backend import make_backend
 from bot_util import YoutubeSearch
+from broadcast import BroadcastChannel
+from downloader import DownloadPool, Prefetcher, SingleFlight, PRIORITY_NOW, PRIORITY_LATER, PRIORITY_IDLE
+from history import PlayHistory
+from library import LocalLibrary, is_local, local_prefix
+from music_settings import load_settings
+from player import GaplessSource, GuildPlayer, TrackSource
+from renderer import MessageRenderer
+from resilience import Endpoint
+from scheduler import DeadlineScheduler
+from song_cache import AudioCache, MetadataCache
+from title_index import FuzzyIndex
+from tracks import Track
 
 
 def setup(bot):
@@ -36,18 +54,154 @@ default_text = """**__Queue list:__**
             For playlists append `-a` after the url.
             Supports YouTube"""
 
+message_limit = 2000  # The number of characters discord allows in a message
+
 default_preview = bt.embed_message("No song playing currently", colour=0xd462fd, footer='Use the prefix ! for commands')
 
+ydl_opts = {
+    'format': 'bestaudio/best',
+    'postprocessors': [{
+        'key': 'FFmpegExtractAudio',
+        'preferredcodec': 'mp3',
+        'preferredquality': '192',
+    }],
+}
+
+opus_ydl_opts = {
+    'format': 'bestaudio[acodec=opus]',
+}
+
+playlist_ydl_opts = {
+    'extract_flat': 'in_playlist',
+}
+
+opus_extensions = ('.webm', '.opus', '.ogg')  # Files holding an Opus stream that can be sent without re-encoding
+
+stream_options = '-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5'  # Lets FFmpeg ride out network blips
+
+stream_tolerance = 5  # The number of seconds a stream may end before the end of its song without being resumed
+
+max_recoveries = 3  # The number of times a song's playback is resumed before it is skipped
+
+mp3_bytes_per_second = 192000 // 8  # Used to estimate the size of a song before it is downloaded
+
+song_meta_keys = ('id', 'title', 'artist', 'track', 'duration')  # The song information kept in the metadata cache
+
+transient_errors = (asyncio.TimeoutError, socket.timeout, ConnectionError, urllib.error.URLError, aiohttp.ClientError)
+
+
+def is_transient(error):
+    """Returns if a failed YouTube call is worth retrying, such as a timeout, a dropped connection or throttling
+
+    youtube_dl wraps the error that stopped it, so the errors it was caused by are checked too. Errors that
+    YouTube answered with, such as an unavailable or private video, are permanent.
+
+    Args:
+        error (Exception): The error raised by the call
+
+    Returns:
+        bool: True if the call may succeed when tried again
+    """
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        if isinstance(error, urllib.error.HTTPError):
+            return error.code == 429 or error.code >= 500
+        if isinstance(error, aiohttp.ClientResponseError):
+            return error.status == 429 or error.status >= 500
+        if isinstance(error, transient_errors):
+            return True
+        exc_info = getattr(error, 'exc_info', None)
+        error = getattr(error, 'cause', None) or (exc_info[1] if exc_info else None) or error.__cause__ or \
+            error.__context__
+    return False
+
+
+def get_song_info(url, timeout=None):
+    """Retrieves the information of the song at url without downloading it
+    
+    Args:
+        url (str): The url of the song
+        timeout (float, optional): The number of seconds youtube_dl waits on YouTube
+    
+    Returns:
+        dict: The song data
+    """
+    with youtube_dl.YoutubeDL(dict(ydl_opts, socket_timeout=timeout)) as ydl:
+        return ydl.extract_info(url, download=False)
+
+
+def download_audio(url, partial, opus=True):
+    """Downloads the audio of a song, as its native Opus stream if it has one and opus is set, or else as mp3
+    
+    Args:
+        url (str): The url of the song
+        partial (str): The path, without an extension, to download to
+        opus (bool, optional): If the native Opus stream is preferred
+    
+    Returns:
+        str: The path of the downloaded file
+    """
+    if opus:
+        download = download_opus(url, partial)
+        if download is not None:
+            return download
+    with youtube_dl.YoutubeDL(dict(ydl_opts, outtmpl=partial + '.%(ext)s')) as ydl:
+        ydl.download([url])
+    return partial + '.mp3'
+
+
+def download_opus(url, partial):
+    """Downloads the native Opus stream of a song without transcoding it
+    
+    Args:
+        url (str): The url of the song
+        partial (str): The path, without an extension, to download to
+    
+    Returns:
+        str: The path of the downloaded file
+        None: If the song has no Opus stream
+    """
+    try:
+        with youtube_dl.YoutubeDL(dict(opus_ydl_opts, outtmpl=partial + '.%(ext)s')) as ydl:
+            info = ydl.extract_info(url, download=True)
+    except youtube_dl.utils.DownloadError:
+        bt.INFO(f'No Opus stream for {url}, transcoding to mp3')
+        return None
+    return partial + '.' + info['ext']
+
+
+def pick_result(results):
+    """Chooses the result of a search most likely to be just the song
+    
+    Args:
+        results (list): The search results
+    
+    Returns:
+        dict: The chosen result
+        None: If no result is useful
+    """
+    useful = []
+    for result in results:
+        if 'lyric' in result.get('title').lower() or 'audio' in result.get('title').lower():
+            useful.append(result)
+
+    if len(useful) == 1:
+        return useful[0]
+    elif len(useful) > 1:
+        # TODO: Figure out a good way to choose between results
+        return useful[0]
+    return None
+
 
 class Music(commands.Cog):
     """The Music cog extension
     
     Attributes:
-        players (dict): The dictionary of players and their current queue of songs 
+        players (dict): The dictionary of guild ids and the player of that guild
+        stations (dict): The dictionary of names and the radio station of that name
     """
 
-    players = {}  # dict with structure as : player: [songs]
-
     _channels = {}
 
     def __init__(self, bot):
@@ -57,8 +211,75 @@ class Music(commands.Cog):
             bot (commands.Bot): The bot initialising the Music extension
         """
         self._bot = bot
+        self.players = {}  # dict with structure as : guild id: GuildPlayer
+        self.stations = {}  # dict with structure as : name: BroadcastChannel
+        self._joins = {}  # dict with structure as : guild id: join in progress
+        self.settings = load_settings()
+        self._pool = DownloadPool(max_workers=self.settings.download_workers)
+        self.cache = AudioCache(directory=self.settings.cache_directory, max_bytes=self.settings.cache_budget)
+        self.metadata = MetadataCache(os.path.join(self.settings.cache_directory, 'metadata.json'),
+                                      ttl=self.settings.metadata_ttl, on_merge=self.index_meta)
+        self.history = PlayHistory(os.path.join(self.settings.cache_directory, 'history.bin'),
+                                   half_life=self.settings.history_half_life)
+        self.backend = make_backend(self.settings.audio_nodes, timeout=self.settings.node_timeout)
+        self.library = LocalLibrary(self.settings.library_directories,
+                                    os.path.join(self.settings.cache_directory, 'library.json'),
+                                    workers=self.settings.library_workers)
+        self.titles = FuzzyIndex(threshold=self.settings.title_match_threshold)
+        for meta in self.metadata.songs():
+            self.index_meta(meta)
+        self.index_library()
+        self._lookups = SingleFlight()
+        self.search_endpoint = Endpoint('YouTube search', timeout=self.settings.search_timeout,
+                                        attempts=self.settings.lookup_attempts,
+                                        base_delay=self.settings.backoff_base, max_delay=self.settings.backoff_cap,
+                                        threshold=self.settings.breaker_threshold,
+                                        reset_timeout=self.settings.breaker_reset,
+                                        hedge_after=self.settings.hedge_after, retryable=is_transient)
+        self.extract_endpoint = Endpoint('YouTube extraction', attempts=self.settings.lookup_attempts,
+                                         base_delay=self.settings.backoff_base, max_delay=self.settings.backoff_cap,
+                                         threshold=self.settings.breaker_threshold,
+                                         reset_timeout=self.settings.breaker_reset,
+                                         hedge_after=self.settings.hedge_after, retryable=is_transient)
+        self.admission = AdmissionController(guild_lookups=self.settings.guild_lookups,
+                                             global_lookups=self.settings.global_lookups,
+                                             max_pending_downloads=self.settings.max_pending_downloads,
+                                             guild_downloads=self.settings.guild_downloads,
+                                             max_queue_length=self.settings.max_queue_length,
+                                             max_track_duration=self.settings.max_track_duration,
+                                             command_rate=self.settings.command_rate,
+                                             command_window=self.settings.command_window)
+        bt.search_cache.max_entries = self.settings.search_cache_size
+        bt.search_cache.ttl = self.settings.search_cache_ttl
+        bt.search_cache.negative_ttl = self.settings.search_negative_ttl
+        self.prefetcher = Prefetcher(self._pool, self.download_song, depth=self.settings.prefetch_depth,
+                                     budget=self.settings.prefetch_budget, on_ready=self.evict_songs,
+                                     slot=self.admission.downloading)
+        self.scheduler = DeadlineScheduler()
+        self.renderer = MessageRenderer(self.get_music_channel, self.render_queue, self.render_preview,
+                                        interval=self.settings.render_interval)
+        self._warming = None
+        if self.library.directories:
+            self._bot.loop.create_task(self.scan_library())
+        if self.settings.warm_top_songs > 0:
+            self.schedule_warming()
         bt.INFO('Initialised Music Cog')
 
+    def cog_unload(self):
+        """Stops the background workers when the extension is unloaded or reloaded
+        """
+        for station in self.stations.values():
+            station.close()
+        self._pool.shutdown()
+        self.scheduler.close()
+        self.renderer.close()
+        self.cache.close()
+        self.metadata.close()
+        self.history.close()
+        if self._warming is not None:
+            self._warming.cancel()
+        self._bot.loop.create_task(bt.close_http_session())
+
     #---------------------------------Channels Attribute---------------------------------
 
     @property
@@ -105,24 +326,33 @@ class Music(commands.Cog):
             data (int): The id of the channel being linked with the guild
         """
         self._channels[str(gid)] = data
+        self.renderer.forget(int(gid))
+
+    def get_music_channel(self, guild):
+        """Gets the music channel of a guild
+        
+        Args:
+            guild (discord.Guild): The guild
+        
+        Returns:
+            discord.TextChannel: The music channel
+            None: If the guild has no music channel setup
+        """
+        return bt.get_channel_by_id(guild, self._channels.get(str(guild.id)))
 
     #------------------------------------General Use-------------------------------------
 
-    def get_voice_client(self, channel):
-        """Summary
+    def get_player(self, guild):
+        """Gets the player of a guild
         
         Args:
-            channel (discord.VoiceChannel): The channel that the bot is in
+            guild (discord.Guild): The guild to get the player of
         
         Returns:
-            None: If there is no voice client in the specified channel
-            discord.Client.voice_client: The voice client in the specified channel
+            None: If the bot is not in a voice channel in the guild
+            GuildPlayer: The player of the guild
         """
-        clients = self.players.keys()
-        for client in clients:
-            if client.channel == channel:
-                return client
-        return None
+        return self.players.get(guild.id)
 
     def get_channel(self, ctx):
         """Gets the voice channel of the user that messaged
@@ -138,6 +368,76 @@ class Music(commands.Cog):
         voice_channel = member.voice.channel
         return voice_channel
 
+    @commands.command(name='cache')
+    @commands.has_permissions(administrator=True)
+    async def cache_stats(self, ctx):
+        """Shows how well the audio cache is doing, Usage: !cache
+        
+        Args:
+            ctx: The context of the call
+        """
+        stats = self.cache.stats
+        plays = self.history.stats
+        lookups = stats['hits'] + stats['misses']
+        rate = 100 * stats['hits'] // lookups if lookups else 0
+        start = f", median start {plays['start']:.1f}s" if plays['start'] is not None else ''
+        message = await ctx.send(embed=bt.embed_message('Audio cache',
+                                                        description=f"{stats['songs']} songs using "
+                                                                    f"{stats['bytes'] // 1_000_000} MB\n"
+                                                                    f"{stats['hits']} hits, {stats['misses']} misses "
+                                                                    f"({rate}% hit rate)\n"
+                                                                    f"{plays['plays']} plays of {plays['songs']} "
+                                                                    f"songs{start}"))
+        await message.delete(delay=10.0)
+
+    @commands.command(name='library')
+    @commands.has_permissions(administrator=True)
+    async def library_scan(self, ctx):
+        """Indexes the songs added to the local library since it was last scanned, Usage: !library
+        
+        Args:
+            ctx: The context of the call
+        """
+        await ctx.message.delete()
+        changes = await self.scan_library()
+        if changes is None:
+            description = 'Unable to scan the library'
+        else:
+            description = (f"{len(self.library)} songs, {changes['added']} added, {changes['updated']} updated, "
+                           f"{changes['removed']} removed")
+        message = await ctx.send(embed=bt.embed_message('Local library', description=description))
+        await message.delete(delay=10.0)
+
+    async def scan_library(self):
+        """Scans the local library off the event loop
+        
+        Returns:
+            dict: The number of songs added, updated and removed
+            None: If the scan failed
+        """
+        try:
+            changes = await asyncio.get_running_loop().run_in_executor(None, self.library.scan)
+        except Exception:
+            ex_type, ex_value, ex_traceback = sys.exc_info()
+            bt.ERROR(f'Unable to scan the local library: {ex_value}')
+            return None
+        self.index_library()
+        return changes
+
+    def index_meta(self, meta):
+        """Adds the names of a song from the metadata cache to the title index
+
+        Args:
+            meta (dict): The metadata of the song
+        """
+        self.titles.add(meta['id'], meta['title'], meta['artist'], meta['track'])
+
+    def index_library(self):
+        """Adds the names of the library songs to the title index, removed songs are dropped once they are asked for
+        """
+        for song_id, title, artist, track in self.library.songs():
+            self.titles.add(song_id, title, artist, track)
+
     #------------------------------------------------------------------------------------
 
     #------------------------------------Join Command------------------------------------
@@ -152,24 +452,45 @@ class Music(commands.Cog):
         await self.do_join(ctx)
 
     async def do_join(self, ctx):
-        """Performs the join of the bot to a channel
+        """Performs the join of the bot to a channel, concurrent joins of a guild share one connection
+        
+        Args:
+            ctx: The context of the call
+        
+        Returns:
+            GuildPlayer: The player of the guild
+        """
+        player = self.get_player(ctx.guild)
+        if player is not None:
+            bt.WARN(f'Already have a player for {ctx.guild.name}!')
+            message = await ctx.send(embed=bt.embed_message('Already in the channel!', colour='orange'))
+            await message.delete(delay=5.0)
+            return player
+
+        gid = ctx.guild.id
+        join = self._joins.get(gid)
+        if join is None:
+            join = asyncio.ensure_future(self.connect(ctx))
+            self._joins[gid] = join
+            join.add_done_callback(lambda _: self._joins.pop(gid, None))
+        return await asyncio.shield(join)
+
+    async def connect(self, ctx):
+        """Connects to the user's voice channel and creates the guild's player
         
         Args:
             ctx: The context of the call
         
         Returns:
-            discord.Client.voice_client: The voice client instance of the bot in the channel
+            GuildPlayer: The player of the guild
+            None: If the bot was unable to join
         """
         try:
             voice_client = await self.get_channel(ctx).connect()
-            if voice_client not in self.players:
-                self.players[voice_client] = []
-            else:
-                bt.WARN(f'{voice_client} is already in the players list!')
-                message = await ctx.send(embed=bt.embed_message('Already in the channel!', colour='orange'))
-                await message.delete(delay=5.0)
-
-            return voice_client
+            player = GuildPlayer(ctx.guild, voice_client)
+            self.players[ctx.guild.id] = player
+            self.start_idle(player)
+            return player
         except BaseException as e:
             ex_type, ex_value, ex_traceback = sys.exc_info()
             bt.ERROR(f'Unable to join channel due to the following error: {ex_value}')
@@ -180,11 +501,11 @@ class Music(commands.Cog):
 
     @commands.command(name='play', aliases=['queue', 'q'])
     async def play_command(self, ctx, *args):
-        """Adds the song to the queue, if the queue is empty it will play it. Usage: !play <url|song name>
+        """Adds the song to the queue, if the queue is empty it will play it. Usage: !play <url|song name> [-a]
         
         Args:
             ctx: The context of the call
-            *args: The name of the song to search for or the url of the song
+            *args: The name of the song to search for or the url of the song, followed by -a for a playlist
         """
 
         await ctx.message.delete()
@@ -192,11 +513,11 @@ class Music(commands.Cog):
         if self._channels.get(str(ctx.guild.id)) is not None:
             if ctx.channel.id == self._channels.get(str(ctx.guild.id)):
 
-                channel = self.get_channel(ctx)
-                client = self.get_voice_client(channel)
+                player = self.get_player(ctx.guild)
 
-                if client is None:
-                    client = await self.do_join(ctx)
+                playlist = len(args) > 0 and args[-1] == '-a'
+                if playlist:
+                    args = args[:-1]
 
                 song = ""
 
@@ -205,21 +526,22 @@ class Music(commands.Cog):
 
                 song = song.strip()
 
-                if client is not None:
-                    if not self.find_url(song):
-                        data = await self.find_song(song)
-                        song = 'https://youtube.com' + data.get('link')
-                    if len(self.players[client]) == 0:
-                        file_data = self.get_song(song)
-                        if file_data is not None:
-                            self.players[client].append(file_data)
-                            bt.INFO(f'Playing song: {file_data["title"]}')
-                            await self.play_song(client, file_data)
-                    else:
-                        file_data = self.get_song(song)
-                        if file_data is not None:
-                            self.players[client].append(file_data)
-                            await self.edit_song_message(client)
+                try:
+                    self.admission.check_rate(ctx.author.id)
+                    self.admission.check_downloads(ctx.guild.id, self._pool.pending)
+                    if player is not None and self.admission.queue_space(len(player.queue)) == 0:
+                        raise AdmissionError('The queue is full!', 'Wait for some songs to finish playing')
+                    with self.admission.lookup(ctx.guild.id):
+                        if player is None:
+                            player = await self.do_join(ctx)
+                            if player is None:
+                                return
+                        if playlist:
+                            await self.queue_playlist(ctx, player, song)
+                        else:
+                            await self.queue_song(ctx, player, song)
+                except AdmissionError as e:
+                    await self.refuse(ctx, e)
             else:
                 music_channel = bt.get_channel_by_id(ctx.guild, self._channels.get(str(ctx.guild.id)))
                 await ctx.send(embed=bt.embed_message("Error!",
@@ -232,19 +554,418 @@ class Music(commands.Cog):
                                                               "'!setup music' for just music",
                                                   colour='red'))
 
-    async def play_song(self, client, file_data):
-        """Plays the song in file_data for the voice client client
+    async def queue_song(self, ctx, player, song):
+        """Looks up a song, searching for it if it is not a url, and queues it
+        
+        Args:
+            ctx: The context of the call
+            player (GuildPlayer): The player to queue the song for
+            song (str): The url or name of the song
+        
+        Raises:
+            AdmissionError: If the song is too long or the queue filled up
+        """
+        file_data = None
+        if not self.find_url(song):
+            file_data = await self.find_known_song(song)
+            if file_data is None:
+                data = await self.find_song(song)
+                if data is None:
+                    await self.lookup_failed(ctx, self.search_endpoint)
+                    return
+                song = 'https://youtube.com' + data.get('link')
+        if file_data is None:
+            priority = PRIORITY_NOW if len(player.queue) == 0 else PRIORITY_LATER
+            file_data = await self.get_song(song, priority=priority)
+            if file_data is None:
+                await self.lookup_failed(ctx, self.extract_endpoint)
+                return
+        self.admission.check_duration(file_data)
+        if await player.submit(self.enqueue, player, file_data) == 0:
+            raise AdmissionError('The queue is full!', 'Wait for some songs to finish playing')
+
+    async def lookup_failed(self, ctx, endpoint):
+        """Tells the user their song could not be found, or that YouTube is failing if its circuit is open
+        
+        Args:
+            ctx: The context of the call
+            endpoint (Endpoint): The YouTube endpoint the song was looked up with
+        """
+        if endpoint.breaker.state != 'closed':
+            embed = bt.embed_message('YouTube is unavailable right now!', description='Try again shortly',
+                                     colour='orange')
+        else:
+            embed = bt.embed_message('Unable to find that song!', colour='orange')
+        message = await ctx.send(embed=embed)
+        await message.delete(delay=5.0)
+
+    async def refuse(self, ctx, error):
+        """Tells the user why their request was turned away
+        
+        Args:
+            ctx: The context of the call
+            error (AdmissionError): The reason
+        """
+        bt.INFO(f'Refused a request from {ctx.author} in {ctx.guild.name}: {error.title}')
+        message = await ctx.send(embed=bt.embed_message(error.title, description=error.description or '',
+                                                        colour='orange'))
+        await message.delete(delay=5.0)
+
+    async def queue_playlist(self, ctx, player, url):
+        """Queues the songs of a playlist, they are only looked up in full as they near the front of the queue
+        
+        Args:
+            ctx: The context of the call
+            player (GuildPlayer): The player to queue the songs for
+            url (str): The url of the playlist
+        """
+        songs = []
+        if self.find_url(url):
+            try:
+                entries = await self._pool.run(PRIORITY_NOW, self.get_playlist_entries, url)
+                songs = [self.make_entry_data(entry) for entry in entries]
+            except Exception:
+                ex_type, ex_value, ex_traceback = sys.exc_info()
+                bt.ERROR(f'Unable to read the playlist {url}: {ex_value}')
+        if len(songs) == 0:
+            message = await ctx.send(embed=bt.embed_message('Unable to find that playlist!', colour='orange'))
+            await message.delete(delay=5.0)
+            return
+        found = len(songs)
+        songs = [song for song in songs if self.admission.allows_duration(song.duration)]
+        queued = await player.submit(self.enqueue_all, player, songs)
+        if not queued:
+            raise AdmissionError('The queue is full!', 'Wait for some songs to finish playing')
+        bt.INFO(f'Queued {queued} songs from a playlist for {player.guild.name}')
+        skipped = f', {found - queued} were too long or did not fit' if queued < found else ''
+        message = await ctx.send(embed=bt.embed_message(f'Queued {queued} songs from the playlist{skipped}'))
+        await message.delete(delay=5.0)
+
+    async def enqueue(self, player, file_data):
+        """Adds a song to the end of a player's queue, starting it if the queue was empty
+        
+        Args:
+            player (GuildPlayer): The player to queue the song for
+            file_data (Track): The song
+        
+        Returns:
+            int: 1 if the song was queued, 0 if the queue is full
+        """
+        return await self.enqueue_all(player, [file_data])
+
+    async def enqueue_all(self, player, songs):
+        """Adds songs to the end of a player's queue, starting the first if the queue was empty
+        
+        Args:
+            player (GuildPlayer): The player to queue the songs for
+            songs (list): The songs, those that do not fit in the queue are dropped
+        
+        Returns:
+            int: The number of songs queued
+        """
+        songs = songs[:self.admission.queue_space(len(player.queue))]
+        if len(songs) == 0:
+            return 0
+        if player.station is not None:
+            await self.tune_out(player)
+        previous = len(player.queue)
+        player.queue.extend(songs)
+        self.scheduler.cancel((player.guild_id, 'idle'))
+        if previous == 0:
+            player.waiting_since = time.monotonic()
+            asyncio.create_task(self.start_when_ready(player, player.queue[0]))
+        else:
+            self.prefetch(player)
+            if previous == 1 and player.output is not None and player.output.near_end:
+                await self.prewarm(player, player.token)
+            self.renderer.update(player)
+        return len(songs)
+
+    def prefetch(self, player):
+        """Looks up and downloads the songs near the front of a player's queue
+        
+        Args:
+            player (GuildPlayer): The player whose queue changed
+        """
+        self.resolve_ahead(player)
+        self.prefetcher.update(player.guild_id, player.queue)
+
+    def resolve_ahead(self, player):
+        """Looks up the next batch of playlist songs once one of them is about to be downloaded
+        
+        Args:
+            player (GuildPlayer): The player whose queue is looked ahead in
+        """
+        window = self.prefetcher.depth + 1
+        if all(song.resolved or song.failed for song in player.queue[:window]):
+            return
+        batch = [song for song in player.queue[:window + self.settings.playlist_batch]
+                 if not song.resolved and not song.failed]
+
+        async def resolve_one(song):
+            with self.admission.downloading(player.guild_id):
+                await self.resolve_song(song, PRIORITY_LATER)
+
+        async def resolve():
+            await asyncio.gather(*map(resolve_one, batch))
+            if not player.closed:
+                self.prefetcher.update(player.guild_id, player.queue)
+
+        asyncio.create_task(resolve())
+
+    async def resolve_song(self, file_data, priority=PRIORITY_NOW):
+        """Fills in the information of a playlist song, concurrent lookups of the same song are shared
+        
+        A song that cannot be looked up is marked as failed, so it is skipped rather than looked up again
+        each time its queue changes.
         
         Args:
-            client (discord.Client.voice_client): The voice client instance to play music to
-            file_data (dict): A dictionary of the file data about the song 
+            file_data (Track): The song
+            priority (int, optional): The priority of the lookup in the download pool
+        
+        Returns:
+            bool: True if the song was looked up, False if it could not be found
         """
-        client.play(discord.FFmpegPCMAudio(file_data['file']))
+        if file_data.resolved:
+            return True
+        if file_data.failed:
+            return False
+        resolved = await self._lookups.run(('song', file_data.id), self.get_song, file_data.link, priority=priority)
+        if resolved is None:
+            bt.WARN(f'Unable to look up {file_data.title} from a playlist')
+            file_data.failed = True
+            return False
+        if not self.admission.allows_duration(resolved.duration):
+            bt.WARN(f'Skipping {resolved.title} from a playlist, it is too long')
+            file_data.failed = True
+            return False
+        for key in song_meta_keys:
+            setattr(file_data, key, getattr(resolved, key))
+        if not file_data.ready:
+            file_data.size = resolved.size
+        file_data.resolved = True
+        return True
+
+    async def start_when_ready(self, player, file_data):
+        """Starts the song at the front of a queue, streaming it while it downloads if progressive playback is on
+        
+        Args:
+            player (GuildPlayer): The player the song is queued for
+            file_data (Track): The song
+        """
+        if not await self.resolve_song(file_data):
+            player.post(self.start_song, player, file_data, False)
+            return
+        if self.settings.progressive_playback and not file_data.ready:
+            self.prefetch(player)
+            source = await self.open_stream(file_data)
+            if source is not None:
+                player.post(self.start_stream, player, file_data, source)
+                return
+        ready = await self.prefetcher.wait(player.guild_id, file_data)
+        player.post(self.start_song, player, file_data, ready)
+
+    async def resume_when_ready(self, player, file_data, position):
+        """Resumes a song from its download once it finishes, or from a new stream if the download stalls
+        
+        Args:
+            player (GuildPlayer): The player the song is queued for
+            file_data (Track): The song
+            position (float): The position in seconds to resume from
+        """
+        try:
+            ready = await asyncio.wait_for(asyncio.shield(self.prefetcher.wait(player.guild_id, file_data)),
+                                           self.settings.stall_timeout)
+        except asyncio.TimeoutError:
+            bt.WARN(f'The download of {file_data.title} has stalled, opening a new stream')
+            source = await self.open_stream(file_data, start=position)
+            if source is not None:
+                player.post(self.start_stream, player, file_data, source)
+                return
+            ready = False
+        player.post(self.start_song, player, file_data, ready, position)
+
+    async def open_stream(self, file_data, start=0):
+        """Opens a stream of a song that is still downloading and buffers the start of it
+        
+        Args:
+            file_data (Track): The song
+            start (float, optional): The position in seconds to start the stream from
+        
+        Returns:
+            TrackSource: The buffered stream
+            None: If the song could not be streamed
+        """
+        try:
+            stream = await self._lookups.run(('stream', file_data.id), self.extract_endpoint.call, self._pool.run,
+                                             PRIORITY_NOW, self.get_stream_url, file_data.link)
+            source = await self.open_source(file_data, start=start, stream=stream)
+            buffered = await asyncio.get_running_loop().run_in_executor(None, source.prebuffer,
+                                                                        self.settings.progressive_prebuffer)
+        except Exception:
+            ex_type, ex_value, ex_traceback = sys.exc_info()
+            bt.WARN(f'Unable to stream {file_data.title}: {ex_value}')
+            return None
+        if buffered == 0:
+            source.cleanup()
+            return None
+        return source
+
+    async def start_stream(self, player, file_data, source):
+        """Starts playing a song from its stream
+        
+        Args:
+            player (GuildPlayer): The player the song is queued for
+            file_data (Track): The song
+            source (TrackSource): The buffered stream of the song
+        """
+        if player.now_playing is not file_data:
+            source.cleanup()
+            return
+        bt.INFO(f'Streaming {file_data.title} while it downloads')
+        await self.play_song(player, file_data, source=source)
+
+    async def start_song(self, player, file_data, ready, start=0):
+        """Starts a downloaded song, or moves past it if its download failed
+        
+        Args:
+            player (GuildPlayer): The player the song is queued for
+            file_data (Track): The song
+            ready (bool): If the song was downloaded
+            start (float, optional): The position in seconds to start the song from
+        """
+        if player.now_playing is not file_data:
+            return
+        if ready:
+            bt.INFO(f'Playing song: {file_data.title}')
+            await self.play_song(player, file_data, start=start)
+        else:
+            await self.advance(player)
+
+    async def play_song(self, player, file_data, start=0, source=None):
+        """Plays the song in file_data for the player
+        
+        Args:
+            player (GuildPlayer): The player to play music to
+            file_data (Track): The song 
+            start (float, optional): The position in seconds to start the song from
+            source (TrackSource, optional): An already opened source of the song, opened off the event loop if not given
+        """
+        if source is None:
+            source = await self.open_source(file_data, start=start)
+        player.token += 1
+        token = player.token
+        player.source = source
+        output = source
+        if self.settings.gapless_playback:
+            loop = self._bot.loop
+            output = GaplessSource(source, lead=self.settings.prewarm_seconds, tolerance=stream_tolerance,
+                                   on_switch=lambda song, track: player.post_threadsafe(loop, self.track_switched,
+                                                                                        player, token, song, track),
+                                   on_near_end=lambda: player.post_threadsafe(loop, self.prewarm, player, token))
+        player.output = output if output is not source else None
+        client = player.voice_client
+        client.play(output, after=lambda error: self.song_finished(player, token, error))
         client.volume = 100
         bt.INFO(f'{client} Playing status: {client.is_playing()}')
-        await self.edit_preview(client)
-        await self.edit_song_message(client)
-        asyncio.create_task(self.play_next(client, file_data['duration']))
+        if player.waiting_since is not None:
+            self.history.record(player.guild_id, file_data.id, time.monotonic() - player.waiting_since)
+            player.waiting_since = None
+        self.prefetch(player)
+        self.renderer.update(player)
+
+    def song_finished(self, player, token, error):
+        """Called from the voice client's thread when a song ends or its playback fails
+        
+        Args:
+            player (GuildPlayer): The player that finished playing
+            token (int): The token of the song that finished
+            error (Exception): The error that stopped playback, if there was one
+        """
+        if error is not None:
+            bt.ERROR(f'Playback for {player.guild.name} stopped due to an error: {error}')
+        player.post_threadsafe(self._bot.loop, self.play_next, player, token)
+
+    async def prewarm(self, player, token):
+        """Opens the next song in the background as the current one is about to end
+        
+        Args:
+            player (GuildPlayer): The player whose song is about to end
+            token (int): The token of the playback the song belongs to
+        """
+        if token != player.token or player.output is None or len(player.queue) < 2:
+            return
+        next_song = player.queue[1]
+        if not next_song.ready:
+            bt.INFO(f'Not pre-opening {next_song.title} as it has not downloaded yet')
+            return
+        asyncio.create_task(self.warm_next(player, token, next_song))
+
+    async def warm_next(self, player, token, file_data):
+        """Starts FFmpeg for the next song and buffers its first frames, then hands it to the playing source
+        
+        Args:
+            player (GuildPlayer): The player the song is queued for
+            token (int): The token of the playback the song will follow
+            file_data (Track): The song
+        """
+        try:
+            source = await self.open_source(file_data)
+            await asyncio.get_running_loop().run_in_executor(None, source.prebuffer,
+                                                             self.settings.progressive_prebuffer)
+        except Exception:
+            ex_type, ex_value, ex_traceback = sys.exc_info()
+            bt.WARN(f'Unable to pre-open {file_data.title}: {ex_value}')
+            return
+        player.post(self.attach_next, player, token, file_data, source)
+
+    async def attach_next(self, player, token, file_data, source):
+        """Queues a pre-opened song to follow the current one, dropping it if the queue has changed since
+        
+        Args:
+            player (GuildPlayer): The player the song is queued for
+            token (int): The token of the playback the song will follow
+            file_data (Track): The song
+            source (TrackSource): The buffered source of the song
+        """
+        if token != player.token or player.output is None or len(player.queue) < 2 or \
+                player.queue[1] is not file_data or not player.output.queue_next(file_data, source):
+            source.cleanup()
+            return
+        bt.INFO(f'Pre-opened {file_data.title} for {player.guild.name}')
+
+    def discard_next(self, player):
+        """Drops the pre-opened next song of a player, this must be called whenever the second song in a queue changes
+        
+        Args:
+            player (GuildPlayer): The player whose queue changed
+        """
+        if player.output is not None:
+            player.output.discard_next()
+
+    async def track_switched(self, player, token, file_data, source):
+        """Catches the queue up after the playing source moved on to the pre-opened song
+        
+        Args:
+            player (GuildPlayer): The player that moved on
+            token (int): The token of the playback that moved on
+            file_data (Track): The song now playing
+            source (TrackSource): The source of the song now playing
+        """
+        if token != player.token:
+            return
+        if len(player.queue) < 2 or player.queue[1] is not file_data:
+            bt.WARN(f'{player.guild.name} moved on to a song that is no longer next, restarting playback')
+            player.token += 1
+            player.voice_client.stop()
+            await self.advance(player)
+            return
+        player.queue.pop(0)
+        player.source = source
+        bt.INFO(f'Playing next song in queue for {player.guild.name} without a gap : {file_data.title}')
+        self.history.record(player.guild_id, file_data.id, 0)
+        self.prefetch(player)
+        self.renderer.update(player)
 
     def find_url(self, string):
         """Determines if the string parsed through is a url
@@ -263,192 +984,483 @@ class Music(commands.Cog):
             bt.INFO('Song was not a url')
             return False
 
-    def get_song(self, url, retries=0):
-        """Prunes the song's data that was retrieved
+    async def get_song(self, url, priority=PRIORITY_NOW):
+        """Prunes the song's data that was retrieved, the song itself is downloaded by the prefetcher
         
         Args:
-            url (str): The url of the song to be downloaded
-            retries (int, optional): The number of retries performed if the fetch has failed
+            url (str): The url of the song to be looked up
+            priority (int, optional): The priority of the lookup in the download pool
         
         Returns:
-            dict: The file data of the song
+            Track: The song
+            None: If the song could not be looked up
         """
+        stored = self.metadata.get(url)
+        if stored is not None:
+            song_info, stale = stored
+            if stale:
+                self.refresh_song_info(url, song_info['meta']['id'])
+            meta = song_info['meta']
+            if meta['id'] not in self.titles:
+                self.index_meta(meta)
+            bt.INFO(f'Found the information of {meta["title"]} in the metadata cache')
+            return self.make_file_data(meta, url, self.cache.lookup(meta['id']))
         try:
-            info = self.download_song(url)
-            file_data = {'file': 'songs/' + info['title'] + '-' + info['id'] + '.mp3', 'title': info['title'],
-                         'artist': info['artist'], 'duration': info['duration'], 'track': info['track'],
-                         'id': info['id'], 'link': url}
-            bt.INFO(f'Title: {file_data["title"]}')
-            bt.INFO(f'Artist: {file_data["artist"]}')
-            bt.INFO(f'Track: {file_data["track"]}')
-            bt.INFO(f'Duration: {file_data["duration"]}')
-            bt.INFO(f'File: {file_data["file"]}')
-            bt.INFO(f'ID: {file_data["id"]}')
+            stored = await self._lookups.run(('info', bt.get_video_id(url) or url), self.lookup_song, url, priority)
+            meta = stored['meta']
+            file_data = self.make_file_data(meta, url, self.cache.lookup(meta['id']))
+            bt.INFO(f'Title: {file_data.title}')
+            bt.INFO(f'Artist: {file_data.artist}')
+            bt.INFO(f'Track: {file_data.track}')
+            bt.INFO(f'Duration: {file_data.duration}')
+            bt.INFO(f'File: {file_data.file}')
+            bt.INFO(f'ID: {file_data.id}')
             return file_data
-        except Exception as e:
-            bt.ERROR(f'Unable to find the requested song: {url}')
-            if retries < 3:
-                return self.get_song(url, retries=retries + 1)
-            else:
-                return None
+        except Exception:
+            ex_type, ex_value, ex_traceback = sys.exc_info()
+            bt.ERROR(f'Unable to find the requested song: {url}: {ex_value}')
+            return None
 
-    def download_song(self, url):
-        """Downloads the song and its information from url
+    async def lookup_song(self, url, priority):
+        """Looks up the information of a song in the download pool and stores it in the metadata cache
         
         Args:
-            url (str): The url of the song to be downloaded
+            url (str): The url of the song
+            priority (int): The priority of the lookup in the download pool
         
         Returns:
-            dict: The song data 
+            dict: The stored entry of the song
         """
-        ydl_opts = {
-            'format': 'bestaudio/best',
-            'outtmpl': 'songs\\%(title)s-%(id)s.mp3',
-            'postprocessors': [{
-                'key': 'FFmpegExtractAudio',
-                'preferredcodec': 'mp3',
-                'preferredquality': '192',
-            }],
-        }
-        with youtube_dl.YoutubeDL(ydl_opts) as ydl:
+        info = await self.extract_endpoint.call(self._pool.run, priority, self.get_song_info, url)
+        stored = self.metadata.put(url, info, song_meta_keys)
+        meta = stored['meta']
+        self.index_meta(meta)
+        return stored
+
+    def refresh_song_info(self, url, video_id):
+        """Refreshes the stored information of a song in the background
+        
+        Args:
+            url (str): The url the song was requested with
+            video_id (str): The YouTube id of the song
+        """
+        if ('info', video_id) in self._lookups:
+            return
+
+        async def refresh():
+            try:
+                stored = await self._lookups.run(('info', video_id), self.lookup_song, url, PRIORITY_IDLE)
+                bt.INFO(f'Refreshed the information of {stored["meta"]["title"]}')
+            except Exception:
+                ex_type, ex_value, ex_traceback = sys.exc_info()
+                bt.WARN(f'Unable to refresh the information of {url}: {ex_value}')
+
+        asyncio.create_task(refresh())
+
+    def make_file_data(self, meta, url, entry=None):
+        """Builds the track that is queued for a song
+        
+        Args:
+            meta (dict): The metadata of the song
+            url (str): The url the song was requested with
+            entry (dict, optional): The audio cache entry of the song if it is already downloaded
+        
+        Returns:
+            Track: The song
+        """
+        if entry is not None:
+            return Track(link=url, file=self.cache.path(meta['id']), size=entry['size'], ready=True, **meta)
+        return Track(link=url, size=int(meta['duration'] or 0) * mp3_bytes_per_second, **meta)
+
+    def make_entry_data(self, entry):
+        """Builds the track of a playlist song from the little that is known about it until it is looked up
+        
+        Args:
+            entry (dict): The flat playlist entry returned by youtube_dl
+        
+        Returns:
+            Track: The song
+        """
+        url = 'https://www.youtube.com/watch?v=' + entry['id']
+        stored = self.metadata.get(url)
+        if stored is not None:
+            return self.make_file_data(stored[0]['meta'], url, self.cache.lookup(entry['id']))
+        return Track(entry['id'], entry.get('title') or url, url, duration=entry.get('duration'), resolved=False,
+                     size=int(entry.get('duration') or 0) * mp3_bytes_per_second)
+
+    def get_playlist_entries(self, url):
+        """Lists the songs of a playlist without looking each of them up, this is called from the download pool
+        
+        Args:
+            url (str): The url of the playlist
+        
+        Returns:
+            list: The flat entries of the playlist
+        """
+        with youtube_dl.YoutubeDL(dict(playlist_ydl_opts, playlistend=self.settings.playlist_limit)) as ydl:
             info = ydl.extract_info(url, download=False)
-            file = 'songs\\' + info['title'] + '-' + info['id'] + '.mp3'
-            if not os.path.isfile(file):
-                ydl.download([url])
-        return info
+        return [entry for entry in info.get('entries') or [] if entry and entry.get('id')]
 
-    async def find_song(self, query, retries=0):
-        """Queries youtube for using a search term
+    def get_song_info(self, url):
+        """Retrieves the information of the song at url without downloading it
+        
+        Args:
+            url (str): The url of the song
+        
+        Returns:
+            dict: The song data
+        """
+        return get_song_info(url, timeout=self.settings.extract_timeout)
+
+    def download_song(self, file_data):
+        """Downloads the song into the audio cache if it is not already there, this is called from the download pool
+        
+        Args:
+            file_data (Track): The song to be downloaded
+        
+        Returns:
+            tuple: tuple containing:
+                    str: the path of the song in the audio cache
+                    int: the size of the file in bytes
+        """
+        file = self.cache.path(file_data.id)
+        if file is None:
+            partial = self.cache.partial_path(file_data.id)
+            try:
+                download = download_audio(file_data.link, partial, opus=self.settings.opus_passthrough)
+            except Exception:
+                self.cache.discard_partial(file_data.id)
+                raise
+            file = self.cache.store(file_data.id, download)
+        return file, os.path.getsize(file)
+
+    async def open_source(self, file_data, start=0, stream=None):
+        """Makes the audio source for a song off the event loop, as starting FFmpeg or reaching an audio node blocks
+        
+        Args:
+            file_data (Track): The song
+            start (float, optional): The position in seconds to start the song from
+            stream (dict, optional): The stream to play from instead of the cached file
+        
+        Returns:
+            TrackSource: The source to play
+        """
+        return await asyncio.get_running_loop().run_in_executor(None, self.make_source, file_data, start, stream)
+
+    def make_source(self, file_data, start=0, stream=None):
+        """Makes the audio source for a song, sending Opus audio to discord without re-encoding it, this blocks
+        
+        Args:
+            file_data (Track): The song
+            start (float, optional): The position in seconds to start the song from
+            stream (dict, optional): The stream to play from instead of the cached file
+        
+        Returns:
+            TrackSource: The source to play
+        """
+        options = [f'-ss {start:.2f}'] if start > 0 else []
+        if stream is not None:
+            options.append(stream_options)
+            location = stream['url']
+            opus = stream['acodec'] == 'opus'
+        else:
+            location = file_data.file
+            if is_local(file_data):
+                opus = self.library.is_opus(location)
+            else:
+                opus = os.path.splitext(location)[1] in opus_extensions
+        before_options = ' '.join(options) or None
+        source = self.backend.open(location, opus, before_options=before_options)
+        return TrackSource(source, start=start, streamed=stream is not None, duration=file_data.duration or None)
+
+    def get_stream_url(self, url):
+        """Gets the direct url of a song's audio stream, this is called from the download pool
+        
+        Args:
+            url (str): The url of the song
+        
+        Returns:
+            dict: The url and codec of the stream
+        """
+        info = None
+        if self.settings.opus_passthrough:
+            try:
+                with youtube_dl.YoutubeDL(opus_ydl_opts) as ydl:
+                    info = ydl.extract_info(url, download=False)
+            except youtube_dl.utils.DownloadError:
+                info = None
+        if info is None:
+            with youtube_dl.YoutubeDL(ydl_opts) as ydl:
+                info = ydl.extract_info(url, download=False)
+        return {'url': info['url'], 'acodec': info.get('acodec')}
+
+    def evict_songs(self):
+        """Trims the audio cache down to its budget, keeping every song that is queued in a guild
+        """
+        queued = [song.id for player in self.players.values() for song in player.queue]
+        queued += [song.id for station in self.stations.values() for song in station.queue]
+        self.cache.evict(keep=queued, popularity=self.history.popularity)
+
+    def schedule_warming(self):
+        """Checks again after the warm interval if it is time to download the most popular songs
+        """
+        self.scheduler.schedule('warm', self.settings.warm_interval, self.start_warming)
+
+    def start_warming(self):
+        """Starts downloading the most popular songs if it is an off-peak hour and they are not already being downloaded
+        """
+        self.schedule_warming()
+        if time.localtime().tm_hour not in self.settings.warm_hours:
+            return
+        if self._warming is None or self._warming.done():
+            self._warming = asyncio.create_task(self.warm_popular())
+
+    async def warm_popular(self):
+        """Looks up and downloads the most popular songs missing from the audio cache, one at a time at idle priority
+        
+        Returns:
+            int: The number of songs downloaded
+        """
+        popular = self.history.top(self.settings.warm_top_songs,
+                                   accept=lambda song_id: not song_id.startswith(local_prefix))
+        warmed = 0
+        for song_id in popular:
+            if time.localtime().tm_hour not in self.settings.warm_hours:
+                bt.INFO('Off-peak hours are over, no longer downloading popular songs')
+                break
+            if self.cache.path(song_id) is not None:
+                continue
+            file_data = await self.get_song('https://www.youtube.com/watch?v=' + song_id, PRIORITY_IDLE)
+            if file_data is None or file_data.ready or not self.admission.allows_duration(file_data.duration):
+                continue
+            warmed += await self.prefetcher.warm(file_data)
+        bt.INFO(f'Downloaded {warmed} of the {len(popular)} most popular songs ahead of time')
+        return warmed
+
+    async def find_known_song(self, query):
+        """Answers a search from the title index of library and previously looked up songs, without a network search
+        
+        Args:
+            query (str): The search terms
+        
+        Returns:
+            Track: The song
+            None: If no known song matches the query well enough
+        """
+        self.metadata.reload()
+        song_id = self.titles.best(query)
+        if song_id is None:
+            return None
+        file_data = None
+        if song_id.startswith(local_prefix):
+            file_data = self.library.get(song_id)
+        else:
+            url = 'https://www.youtube.com/watch?v=' + song_id
+            if self.metadata.get(url) is not None:
+                file_data = await self.get_song(url)
+        if file_data is None:
+            self.titles.remove(song_id)
+            return None
+        bt.INFO(f'Found {file_data.title} for {query} in the title index')
+        return file_data
+
+    async def find_song(self, query):
+        """Queries youtube for using a search term, searching again with backoff while nothing useful is found
         
         Args:
             query (str): The search terms used to search youtube
-            retries (int, optional): The number of retries if the search fails
         
         Returns:
-            str: The url of the found son
+            dict: The search result of the found song
+            None: If no useful result was found
         """
-        results = YoutubeSearch(query, max_results=10).to_dict()
-        useful = []
-        for result in results:
-            if 'lyric' in result.get('title').lower() or 'audio' in result.get('title').lower():
-                useful.append(result)
+        if bt.search_cache.get(query, max_results=10) == []:
+            bt.INFO(f'Not searching for {query} as it recently found nothing useful')
+            return None
+        searches = itertools.count()
+
+        async def search():
+            found = await YoutubeSearch.create(query, max_results=10, use_cache=next(searches) == 0)
+            return pick_result(found.to_dict())
 
-        if len(useful) == 1:
-            return useful[0]
-        elif len(useful) > 1:
-            # TODO: Figure out a good way to choose between results
-            return useful[0]
-        elif retries < 5:
-            await asyncio.sleep(1)
-            return await self.find_song(query, retries=retries + 1)
+        try:
+            result = await self.search_endpoint.call(search, accept=lambda result: result is not None)
+        except Exception:
+            ex_type, ex_value, ex_traceback = sys.exc_info()
+            bt.WARN(f'Unable to search for {query}: {ex_value}')
+            return None
+        if result is None:
+            bt.search_cache.put(query, [], max_results=10)
+        return result
 
     #------------------------------------------------------------------------------------
 
     #-----------------------------------Queue Updates------------------------------------
 
-    async def play_next(self, player, timer):
-        """Summary
+    async def play_next(self, player, token):
+        """Moves the queue on to the next song once the current one has finished
         
         Args:
-            player (discord.Client.voice_client): The voice client to get the queue of
-            timer (str): The time in seconds to wait for
+            player (GuildPlayer): The player whose song finished
+            token (int): The token of the song that finished
         """
-        try:
-            time = int(timer)
-            await asyncio.sleep(time + 3)
-            bt.INFO(f'Sleeping for {timer} seconds for player {player}')
-            if len(self.players[player]) == 1:
-                bt.INFO(f'No more songs to play for {player}')
-                self.players[player] = []
-                await self.edit_song_message(player)
-                asyncio.create_task(self.empty(player, datetime.datetime.now()))
-            elif len(self.players[player]) > 1:
-                self.players[player].pop(0)
-                next_song = self.players[player][0]
-                bt.INFO(f'Playing next song in queue for {player} : {next_song["title"]}')
-                await self.play_song(player, next_song)
-        except BaseException as e:
-            ex_type, ex_value, ex_traceback = sys.exc_info()
-            bt.ERROR(f'Unable to play the next song due to an error: {ex_value}')
+        if token != player.token:
+            return
+        song = player.now_playing
+        source = player.source
+        if source is not None and song is not None and source.ended_early(stream_tolerance):
+            await self.recover_stream(player, song, source.position)
+            return
+        await self.advance(player)
+
+    async def recover_stream(self, player, file_data, position):
+        """Resumes a song whose stream ended early, from its download if it has finished
+        
+        Args:
+            player (GuildPlayer): The player playing the song
+            file_data (Track): The song
+            position (float): The position in seconds the stream reached
+        """
+        file_data.recoveries += 1
+        if file_data.recoveries > max_recoveries:
+            bt.ERROR(f'Giving up on {file_data.title} after {max_recoveries} failed streams')
+            await self.advance(player)
+            return
+        bt.WARN(f'The stream of {file_data.title} ended early at {position:.0f}s, resuming it')
+        if file_data.ready:
+            await self.play_song(player, file_data, start=position)
+        else:
+            asyncio.create_task(self.resume_when_ready(player, file_data, position))
 
-    async def empty(self, player, time):
-        """Loops when a voice client's queue is empty for 50 seconds and then leaves if still empty
+    async def advance(self, player):
+        """Removes the song at the front of the queue and starts the next one
         
         Args:
-            player (discord.Client.voice_client): The voice client that is being polled for being empty
-            time (datetime): The time at which the queue first became empty
+            player (GuildPlayer): The player to advance
         """
-        if len(self.players[player]) == 0:
-            now_time = datetime.datetime.now()
-            diff = now_time - time
-            if diff.seconds >= 50:
-                try:
-                    bt.INFO(f'Leaving {player.channel} as no songs have been added')
-                    await self.edit_preview(player, default=True)
-                    del self.players[player]
-                    await player.disconnect()
-                except Exception:
-                    bt.ERROR(f'Unable to delete {player} from my players')
-            else:
-                await asyncio.sleep(10)
-                await self.empty(player, time)
+        if len(player.queue) == 0:
+            return
+        player.queue.pop(0)
+        if len(player.queue) == 0:
+            player.waiting_since = None
+            bt.INFO(f'No more songs to play for {player.guild.name}')
+            self.renderer.update(player)
+            self.start_idle(player)
+            return
+        next_song = player.queue[0]
+        bt.INFO(f'Playing next song in queue for {player.guild.name} : {next_song.title}')
+        player.waiting_since = time.monotonic()
+        if next_song.ready:
+            await self.play_song(player, next_song)
+        else:
+            asyncio.create_task(self.start_when_ready(player, next_song))
+
+    def start_idle(self, player):
+        """Starts the countdown to leaving a player's channel, it is cancelled as soon as a song is queued
+        
+        Args:
+            player (GuildPlayer): The player whose queue is empty
+        """
+        self.scheduler.schedule((player.guild_id, 'idle'), self.settings.idle_timeout, self.idle_expired, player)
+
+    def idle_expired(self, player):
+        """Leaves a player's channel once its queue has been empty for the idle timeout
+        
+        Args:
+            player (GuildPlayer): The player whose queue stayed empty
+        """
+        if player.closed or len(player.queue) > 0:
+            return
+        bt.INFO(f'Leaving {player.voice_client.channel} as no songs have been added')
+        player.post(self.disconnect, player, True)
 
-    async def edit_song_message(self, client):
-        """Edits the message in the music channel to represent the queue
+    async def disconnect(self, player, idle=False):
+        """Disconnects a player from voice and forgets it
         
         Args:
-            client (discord.Client.voice_client): The client to retrieve the queue from
+            player (GuildPlayer): The player to disconnect
+            idle (bool, optional): If the player is leaving for being idle, in which case it stays if songs were queued
+        """
+        if idle and len(player.queue) > 0:
+            return
+        if self.players.get(player.guild_id) is player:
+            del self.players[player.guild_id]
+            self.scheduler.cancel((player.guild_id, 'idle'))
+        self.prefetcher.clear(player.guild_id)
+        player.queue.clear()
+        player.output = None
+        player.station = None
+        player.close()
+        await player.voice_client.disconnect()
+        self.renderer.update(player)
+
+    def render_queue(self, player):
+        """Makes the queue message, showing the song playing and only the player's current page of the songs after it
+        
+        Args:
+            player (GuildPlayer): The player to retrieve the queue from
+        
+        Returns:
+            str: The contents of the queue message
         """
-        guild = client.guild
-        channel_id = self._channels.get(str(guild.id))
-        channel = bt.get_channel_by_id(guild, channel_id)
-        last_message = await channel.history().flatten()
-        last_message = last_message[0]
         contents = default_text
-        for song in self.players.get(client):
-            contents += self.get_song_title(song)
-        await last_message.edit(content=contents)
-
-    async def edit_preview(self, client, default=False):
-        """Changes the preview message in the song channel to the currently playing song
-        
-        Args:
-            client (discord.Client.voice_client): The client to retrieve the queue from
-            default (bool, optional): A flag to determine if the queue is empty or not
-        """
-        guild = client.guild
-        channel_id = self._channels.get(str(guild.id))
-        channel = bt.get_channel_by_id(guild, channel_id)
-        last_message = await channel.history().flatten()
-        last_message = last_message[1]
-        if not default:
-            top_song = self.players.get(client)[0]
-            title = self.get_song_title(top_song)
-            preview = discord.Embed(title=title, colour=discord.Colour(0xd462fd), url=top_song.get('link'),
-                                    video=top_song.get('link'))
-            preview.set_image(url="http://img.youtube.com/vi/%s/0.jpg" % top_song.get('id'))
-            preview.set_footer(text='Use the prefix ! for commands')
+        if player.station is not None:
+            contents += f'\nListening to the {player.station.name} radio'
+            if player.station.now_playing is not None:
+                contents += self.get_song_title(player.station.now_playing)
+            return contents
+        if len(player.queue) == 0:
+            return contents
+        contents += self.get_song_title(player.queue[0])
+        size = self.settings.queue_page_size
+        pages = max(1, -(-(len(player.queue) - 1) // size))
+        player.page = min(max(player.page, 0), pages - 1)
+        start = 1 + player.page * size
+        for position, song in enumerate(player.queue[start:start + size], start):
+            contents += f'\n{position}. ' + self.get_song_title(song).lstrip('\n')
+        if pages > 1:
+            contents += f'\n\nPage {player.page + 1}/{pages} of {len(player.queue) - 1} songs, use `!page <number>`'
+        return contents[:message_limit]
+
+    def render_preview(self, player):
+        """Makes the preview embed, showing the song playing unless playback is paused or over
+        
+        Args:
+            player (GuildPlayer): The player to retrieve the queue from
+        
+        Returns:
+            discord.Embed: The embed of the preview message
+        """
+        top_song = player.now_playing if player.station is None else player.station.now_playing
+        if player.closed or top_song is None or player.voice_client.is_paused():
+            return default_preview
+        title = self.get_song_title(top_song)
+        if is_local(top_song):
+            preview = discord.Embed(title=title, colour=discord.Colour(0xd462fd))
         else:
-            preview = default_preview
-        await last_message.edit(embed=preview)
+            preview = discord.Embed(title=title, colour=discord.Colour(0xd462fd), url=top_song.link,
+                                    video=top_song.link)
+            preview.set_image(url="http://img.youtube.com/vi/%s/0.jpg" % top_song.id)
+        preview.set_footer(text='Use the prefix ! for commands')
+        return preview
 
     def get_song_title(self, song):
         """Makes the header of the preview embed and the queue name
         
         Args:
-            song (dict): The songs file data
+            song (Track): The song
         
         Returns:
             str: The name displayed in the queue and the preview embed
         """
-        mins = int(song["duration"]) // 60
-        seconds = int(song["duration"]) % 60
-        if song["track"] is None or song["artist"] is None:
-            title = song["title"]
+        mins = int(song.duration or 0) // 60
+        seconds = int(song.duration or 0) % 60
+        if song.track is None or song.artist is None:
+            title = song.title
             title = re.sub('((\()?([Ll])yric(s)? (\))?)|((\()?([Aa])udio)(\))?', '', title)
             contents = f'\n{title} ({mins}:{seconds})'
         else:
-            contents = f'\n{song["track"]} - {song["artist"]} ({mins}:{seconds})'
+            contents = f'\n{song.track} - {song.artist} ({mins}:{seconds})'
         return contents
 
     #------------------------------------------------------------------------------------
@@ -463,13 +1475,25 @@ class Music(commands.Cog):
             ctx: The context of the call
         """
         await ctx.message.delete()
-        channel = self.get_channel(ctx)
-        client = self.get_voice_client(channel)
-        bt.INFO(f'Stopped playback for {client}')
+        player = self.get_player(ctx.guild)
 
-        if client is not None:
-            client.stop()
-            self.players[client] = []
+        if player is not None:
+            bt.INFO(f'Stopped playback for {ctx.guild.name}')
+            await player.submit(self.stop_playback, player)
+
+    async def stop_playback(self, player):
+        """Clears the queue of a player and stops the song playing
+        
+        Args:
+            player (GuildPlayer): The player to stop
+        """
+        player.queue.clear()
+        player.token += 1
+        player.output = None
+        player.station = None
+        self.prefetcher.clear(player.guild_id)
+        player.voice_client.stop()
+        self.start_idle(player)
 
     @commands.command(name='pause', aliases=['p'])
     async def pause(self, ctx):
@@ -479,13 +1503,23 @@ class Music(commands.Cog):
             ctx: The context of the call
         """
         await ctx.message.delete()
-        channel = self.get_channel(ctx)
-        client = self.get_voice_client(channel)
-        bt.INFO(f'Paused playback for {client}')
+        player = self.get_player(ctx.guild)
 
-        if client is not None:
-            client.pause()
-            await self.edit_preview(client, default=True)
+        if player is not None:
+            bt.INFO(f'Paused playback for {ctx.guild.name}')
+            await player.submit(self.pause_playback, player)
+
+    async def pause_playback(self, player):
+        """Pauses the song playing for a player
+        
+        Args:
+            player (GuildPlayer): The player to pause
+        """
+        if player.voice_client.is_playing():
+            player.voice_client.pause()
+            if player.source is not None:
+                self.backend.pause(player.source.source)
+            self.renderer.update(player)
 
     @commands.command(name='resume', aliases=['r'])
     async def resume(self, ctx):
@@ -495,14 +1529,23 @@ class Music(commands.Cog):
             ctx: The context of the call
         """
         await ctx.message.delete()
-        channel = self.get_channel(ctx)
-        client = self.get_voice_client(channel)
-        bt.INFO(f'Resumed playback for {client}')
+        player = self.get_player(ctx.guild)
 
-        if client is not None:
-            if client.is_paused():
-                client.resume()
-                await self.edit_preview(client)
+        if player is not None:
+            bt.INFO(f'Resumed playback for {ctx.guild.name}')
+            await player.submit(self.resume_playback, player)
+
+    async def resume_playback(self, player):
+        """Resumes the paused song of a player
+        
+        Args:
+            player (GuildPlayer): The player to resume
+        """
+        if player.voice_client.is_paused():
+            if player.source is not None:
+                self.backend.resume(player.source.source)
+            player.voice_client.resume()
+            self.renderer.update(player)
 
     @commands.command()
     async def leave(self, ctx):
@@ -512,19 +1555,155 @@ class Music(commands.Cog):
             ctx: The context of the call
         """
         await ctx.message.delete()
-        channel = self.get_channel(ctx)
-        client = self.get_voice_client(channel)
+        player = self.get_player(ctx.guild)
 
-        if client is not None:
-            bt.INFO(f'Leaving {channel}')
-            await client.disconnect()
-            await self.edit_preview(client, default=True)
-            try:
-                del self.players[client]
-            except BaseException as e:
-                ex_type, ex_value, ex_traceback = sys.exc_info()
-                bt.ERROR(f'Tried to remove {client} from list but it did not exist')
-                bt.ERROR(f'Encountered the following error: {ex_value}')
+        if player is not None:
+            bt.INFO(f'Leaving {player.voice_client.channel}')
+            await player.submit(self.disconnect, player)
+
+    @commands.command(name='page')
+    async def page(self, ctx, number: int = 1):
+        """Shows a page of the queue in the queue message, Usage: !page <number>
+        
+        Args:
+            ctx: The context of the call
+            number (int, optional): The page to show, starting from 1
+        """
+        await ctx.message.delete()
+        player = self.get_player(ctx.guild)
+
+        if player is not None:
+            await player.submit(self.show_page, player, number - 1)
+
+    async def show_page(self, player, page):
+        """Changes the page of the queue shown in the queue message
+        
+        Args:
+            player (GuildPlayer): The player whose queue is shown
+            page (int): The page to show, starting from 0
+        """
+        player.page = page
+        self.renderer.update(player)
+
+    @commands.command(name='move', aliases=['mv'])
+    async def move(self, ctx, source: int, destination: int):
+        """Moves a song to another position in the queue, Usage: !move <position> <new position>
+        
+        Args:
+            ctx: The context of the call
+            source (int): The position of the song in the queue message
+            destination (int): The position to move the song to
+        """
+        await ctx.message.delete()
+        player = self.get_player(ctx.guild)
+
+        if player is not None:
+            if await player.submit(self.move_song, player, source, destination) is False:
+                await self.invalid_positions(ctx)
+
+    async def move_song(self, player, source, destination):
+        """Moves a song that has not started playing to another position in a player's queue
+        
+        Args:
+            player (GuildPlayer): The player whose queue is edited
+            source (int): The position of the song
+            destination (int): The position to move the song to
+        
+        Returns:
+            bool: False if either position is not an upcoming song
+        """
+        if not (0 < source < len(player.queue) and 0 < destination < len(player.queue)):
+            return False
+        next_song = player.queue[1]
+        player.queue.move(source, destination)
+        await self.queue_changed(player, next_song)
+        return True
+
+    @commands.command(name='remove', aliases=['rm'])
+    async def remove(self, ctx, start: int, end: int = None):
+        """Removes a song, or a range of songs, from the queue, Usage: !remove <position> [last position]
+        
+        Args:
+            ctx: The context of the call
+            start (int): The position of the first song to remove
+            end (int, optional): The position of the last song to remove, only start is removed if not given
+        """
+        await ctx.message.delete()
+        player = self.get_player(ctx.guild)
+
+        if player is not None:
+            if end is None:
+                end = start
+            if await player.submit(self.remove_songs, player, start, end) is False:
+                await self.invalid_positions(ctx)
+
+    async def remove_songs(self, player, start, end):
+        """Removes upcoming songs from a player's queue
+        
+        Args:
+            player (GuildPlayer): The player whose queue is edited
+            start (int): The position of the first song to remove
+            end (int): The position of the last song to remove
+        
+        Returns:
+            bool: False if the range is not made of upcoming songs
+        """
+        if not 0 < start <= end < len(player.queue):
+            return False
+        next_song = player.queue[1]
+        removed = player.queue.remove_range(start, end + 1)
+        bt.INFO(f'Removed {len(removed)} songs from the queue of {player.guild.name}')
+        await self.queue_changed(player, next_song)
+        return True
+
+    @commands.command(name='shuffle')
+    async def shuffle(self, ctx):
+        """Shuffles the songs after the one playing, Usage: !shuffle
+        
+        Args:
+            ctx: The context of the call
+        """
+        await ctx.message.delete()
+        player = self.get_player(ctx.guild)
+
+        if player is not None:
+            bt.INFO(f'Shuffling the queue of {ctx.guild.name}')
+            await player.submit(self.shuffle_songs, player)
+
+    async def shuffle_songs(self, player):
+        """Shuffles the upcoming songs of a player's queue
+        
+        Args:
+            player (GuildPlayer): The player whose queue is shuffled
+        """
+        if len(player.queue) < 3:
+            return
+        next_song = player.queue[1]
+        player.queue.shuffle(start=1)
+        await self.queue_changed(player, next_song)
+
+    async def queue_changed(self, player, next_song):
+        """Catches the pre-opened song, the prefetcher and the queue message up with an edited queue
+        
+        Args:
+            player (GuildPlayer): The player whose queue was edited
+            next_song (Track): The song that was second in the queue before the edit
+        """
+        if len(player.queue) < 2 or player.queue[1] is not next_song:
+            self.discard_next(player)
+        self.prefetch(player)
+        self.renderer.update(player)
+
+    async def invalid_positions(self, ctx):
+        """Tells the user that the positions they gave are not upcoming songs in the queue
+        
+        Args:
+            ctx: The context of the call
+        """
+        message = await ctx.send(embed=bt.embed_message('Those positions are not in the queue!',
+                                                        description='Use the numbers shown in the queue message',
+                                                        colour='orange'))
+        await message.delete(delay=5.0)
 
     @commands.command()
     async def skip(self, ctx):
@@ -534,12 +1713,257 @@ class Music(commands.Cog):
             ctx: The context of the call
         """
         await ctx.message.delete()
-        channel = self.get_channel(ctx)
-        client = self.get_voice_client(channel)
+        player = self.get_player(ctx.guild)
+
+        if player is not None:
+            bt.INFO(f'Skipping song for {ctx.guild.name}')
+            await player.submit(self.skip_song, player)
+
+    async def skip_song(self, player):
+        """Skips the song at the front of a player's queue
+        
+        Args:
+            player (GuildPlayer): The player to skip the song of
+        """
+        if player.station is not None:
+            await self.tune_out(player)
+            return
+        player.token += 1
+        player.output = None
+        player.voice_client.stop()
+        await self.advance(player)
+
+    @commands.command()
+    async def seek(self, ctx, seconds: int):
+        """Plays the current song from another position, Usage: !seek <seconds>
+        
+        Args:
+            ctx: The context of the call
+            seconds (int): The position in seconds to play the song from
+        """
+        await ctx.message.delete()
+        player = self.get_player(ctx.guild)
+
+        if player is not None:
+            if await player.submit(self.seek_song, player, seconds) is False:
+                message = await ctx.send(embed=bt.embed_message('Unable to seek in this song!',
+                                                                description='Wait for it to finish downloading',
+                                                                colour='orange'))
+                await message.delete(delay=5.0)
+
+    async def seek_song(self, player, seconds):
+        """Plays the song at the front of a player's queue again from a position
+        
+        Args:
+            player (GuildPlayer): The player to seek in
+            seconds (int): The position in seconds to play the song from
+        
+        Returns:
+            bool: False if there is no downloaded song to seek in
+        """
+        file_data = player.now_playing
+        if file_data is None or player.station is not None or not file_data.ready:
+            return False
+        if file_data.duration:
+            seconds = min(seconds, int(file_data.duration) - 1)
+        bt.INFO(f'Seeking to {seconds}s in {file_data.title} for {player.guild.name}')
+        player.token += 1
+        player.output = None
+        player.voice_client.stop()
+        await self.play_song(player, file_data, start=max(0, seconds))
+        return True
+
+    #------------------------------------------------------------------------------------
+
+    #-----------------------------------Radio Commands-----------------------------------
+
+    @commands.group(name='radio', invoke_without_command=True)
+    async def radio(self, ctx):
+        """Lists the radio stations, Usage: !radio [start|stop|join|leave]
+        
+        Args:
+            ctx: The context of the call
+        """
+        await ctx.message.delete()
+        description = ''
+        for station in self.stations.values():
+            description += f'\n**{station.name}** ({station.listeners} listening)'
+            if station.now_playing is not None:
+                description += self.get_song_title(station.now_playing)
+        message = await ctx.send(embed=bt.embed_message('Radio stations', description=description or 'None running'))
+        await message.delete(delay=10.0)
+
+    @radio.command(name='start')
+    @commands.has_permissions(administrator=True)
+    async def radio_start(self, ctx, name, url):
+        """Starts a radio station playing a playlist on repeat, Usage: !radio start <name> <playlist url>
+        
+        Args:
+            ctx: The context of the call
+            name (str): The name of the station
+            url (str): The url of the playlist
+        """
+        await ctx.message.delete()
+        if name in self.stations:
+            message = await ctx.send(embed=bt.embed_message(f'The {name} radio is already running!', colour='orange'))
+            await message.delete(delay=5.0)
+            return
+        try:
+            entries = await self._pool.run(PRIORITY_NOW, self.get_playlist_entries, url)
+        except Exception:
+            ex_type, ex_value, ex_traceback = sys.exc_info()
+            bt.ERROR(f'Unable to read the playlist {url}: {ex_value}')
+            entries = []
+        if len(entries) == 0:
+            message = await ctx.send(embed=bt.embed_message('Unable to find that playlist!', colour='orange'))
+            await message.delete(delay=5.0)
+            return
+        station = BroadcastChannel(name, [self.make_entry_data(entry) for entry in entries])
+        self.stations[name] = station
+        asyncio.create_task(self.run_station(station))
+        bt.INFO(f'Started the {name} radio with {len(station.queue)} songs')
+        message = await ctx.send(embed=bt.embed_message(f'Started the {name} radio',
+                                                        description=f'Use `!radio join {name}` to listen'))
+        await message.delete(delay=5.0)
+
+    @radio.command(name='stop')
+    @commands.has_permissions(administrator=True)
+    async def radio_stop(self, ctx, name):
+        """Stops a radio station, every guild listening to it goes back to its own queue, Usage: !radio stop <name>
+        
+        Args:
+            ctx: The context of the call
+            name (str): The name of the station
+        """
+        await ctx.message.delete()
+        station = self.stations.pop(name, None)
+        if station is not None:
+            bt.INFO(f'Stopping the {name} radio')
+            station.close()
+
+    @radio.command(name='join')
+    async def radio_join(self, ctx, name):
+        """Tunes the bot in to a radio station in place of the queue, Usage: !radio join <name>
+        
+        Args:
+            ctx: The context of the call
+            name (str): The name of the station
+        """
+        await ctx.message.delete()
+        station = self.stations.get(name)
+        if station is None:
+            message = await ctx.send(embed=bt.embed_message(f'There is no {name} radio!', colour='orange'))
+            await message.delete(delay=5.0)
+            return
+        player = self.get_player(ctx.guild)
+        if player is None:
+            player = await self.do_join(ctx)
+        if player is not None:
+            bt.INFO(f'{ctx.guild.name} is tuning in to the {name} radio')
+            await player.submit(self.tune_in, player, station)
+
+    @radio.command(name='leave')
+    async def radio_leave(self, ctx):
+        """Stops listening to the radio, Usage: !radio leave
+        
+        Args:
+            ctx: The context of the call
+        """
+        await ctx.message.delete()
+        player = self.get_player(ctx.guild)
 
-        if client is not None:
-            bt.INFO(f'Skipping song for client {client}')
-            client.pause()
-            asyncio.create_task(self.play_next(client, -3))
+        if player is not None:
+            await player.submit(self.tune_out, player)
 
-    #------------------------------------------------------------------------------------
\ No newline at end of file
+    async def run_station(self, station):
+        """Plays the songs of a station one after the other until it is stopped
+        
+        Args:
+            station (BroadcastChannel): The station to run
+        """
+        key = ('radio', station.name)
+        loop = asyncio.get_running_loop()
+        while not station.closed and len(station.queue) > 0:
+            song = station.queue[0]
+            ready = await self.resolve_song(song) and await self.prefetcher.wait(key, song)
+            self.prefetcher.update(key, station.queue)
+            if ready and not station.closed:
+                source = await self.open_source(song)
+                self.station_changed(station)
+                try:
+                    finished = await loop.run_in_executor(station.executor, station.pump, source)
+                except Exception:
+                    ex_type, ex_value, ex_traceback = sys.exc_info()
+                    bt.ERROR(f'The {station.name} radio failed to play {song.title}: {ex_value}')
+                    finished = not station.closed
+                finally:
+                    source.cleanup()
+                if not finished:
+                    break
+            if station.closed:
+                break
+            station.queue.pop(0)
+            if station.repeat and ready:
+                station.queue.append(song)
+        self.prefetcher.clear(key)
+        if self.stations.get(station.name) is station:
+            del self.stations[station.name]
+            station.close()
+        bt.INFO(f'The {station.name} radio has stopped')
+
+    def station_changed(self, station):
+        """Updates the messages of every guild listening to a station
+        
+        Args:
+            station (BroadcastChannel): The station whose song changed
+        """
+        for player in self.players.values():
+            if player.station is station:
+                self.renderer.update(player)
+
+    async def tune_in(self, player, station):
+        """Stops a player's own playback and plays a station instead
+        
+        Args:
+            player (GuildPlayer): The player to tune in
+            station (BroadcastChannel): The station to listen to
+        """
+        await self.stop_playback(player)
+        self.scheduler.cancel((player.guild_id, 'idle'))
+        token = player.token
+        player.station = station
+        player.voice_client.play(station.subscribe(),
+                                 after=lambda error: player.post_threadsafe(self._bot.loop, self.station_ended,
+                                                                            player, token))
+        self.renderer.update(player)
+
+    async def tune_out(self, player):
+        """Stops listening to the station a player is tuned in to
+        
+        Args:
+            player (GuildPlayer): The player to tune out
+        """
+        if player.station is None:
+            return
+        bt.INFO(f'{player.guild.name} stopped listening to the {player.station.name} radio')
+        player.token += 1
+        player.station = None
+        player.voice_client.stop()
+        self.start_idle(player)
+        self.renderer.update(player)
+
+    async def station_ended(self, player, token):
+        """Called once a player stops playing a station, because it was stopped or the player tuned out
+        
+        Args:
+            player (GuildPlayer): The player that was listening
+            token (int): The token of the player when it tuned in
+        """
+        if token != player.token or player.station is None:
+            return
+        bt.INFO(f'The {player.station.name} radio ended for {player.guild.name}')
+        player.station = None
+        self.start_idle(player)
+        self.renderer.update(player)
+
+    #------------------------------------------------------------------------------------
@@ -0,0 +1,201 @@
+import math
+import time
+from collections import deque
+from contextlib import contextmanager
+
+
+class AdmissionError(Exception):
+    """Raised when a request is turned away, its title and description are shown to the user
+
+    Attributes:
+        title (str): The reason the request was refused
+        description (str): What the user can do about it
+    """
+
+    def __init__(self, title, description=None):
+        """Initialises the error
+
+        Args:
+            title (str): The reason the request was refused
+            description (str, optional): What the user can do about it
+        """
+        super().__init__(title)
+        self.title = title
+        self.description = description
+
+
+class AdmissionController:
+    """Decides if the work asked for by a command is taken on, refusing it instead of letting it pile up
+
+    Every check either returns or raises an AdmissionError, none of them wait. Lookups hold a slot of their
+    guild and a global slot while they run. Downloads are already run by a fixed number of workers, so
+    new songs are refused once too many downloads are waiting for one, or once a guild has too many of
+    its own downloads in flight so that it cannot take up the whole pool.
+
+    Attributes:
+        admitted (int): The number of requests let through
+        shed (int): The number of requests refused
+    """
+
+    def __init__(self, guild_lookups=2, global_lookups=16, max_pending_downloads=64, guild_downloads=8,
+                 max_queue_length=1000, max_track_duration=10800, command_rate=5, command_window=10):
+        """Initialises the controller
+
+        Args:
+            guild_lookups (int, optional): The number of searches and lookups a guild may run at once
+            global_lookups (int, optional): The number of searches and lookups run at once across every guild
+            max_pending_downloads (int, optional): The number of downloads waiting for a worker before new songs
+                are refused
+            guild_downloads (int, optional): The number of downloads a guild may have in flight before its new
+                songs are refused
+            max_queue_length (int, optional): The number of songs a guild's queue may hold
+            max_track_duration (int, optional): The length in seconds of the longest song that may be queued
+            command_rate (int, optional): The number of commands a user may send within command_window
+            command_window (float, optional): The number of seconds command_rate applies to
+        """
+        self.guild_lookups = guild_lookups
+        self.global_lookups = global_lookups
+        self.max_pending_downloads = max_pending_downloads
+        self.guild_downloads = guild_downloads
+        self.max_queue_length = max_queue_length
+        self.max_track_duration = max_track_duration
+        self.command_rate = command_rate
+        self.command_window = command_window
+        self.admitted = 0
+        self.shed = 0
+        self._lookups = {}  # dict with structure as : guild id: lookups running
+        self._running = 0
+        self._downloads = {}  # dict with structure as : guild id: downloads in flight
+        self._commands = {}  # dict with structure as : user id: deque of command times
+
+    def check_rate(self, user_id):
+        """Counts a command of a user, refusing it if they have sent too many recently
+
+        Args:
+            user_id (int): The id of the user
+
+        Raises:
+            AdmissionError: If the user is over their command rate
+        """
+        now = time.monotonic()
+        times = self._commands.setdefault(user_id, deque())
+        while times and times[0] <= now - self.command_window:
+            times.popleft()
+        if len(times) >= self.command_rate:
+            wait = times[0] + self.command_window - now
+            self._refuse('You are sending commands too quickly!', f'Try again in {math.ceil(wait)} seconds')
+        times.append(now)
+        if len(self._commands) > 1024:
+            self._forget_users(now)
+
+    def check_downloads(self, gid, pending):
+        """Refuses new songs while too many downloads are waiting for a worker, or the guild has too many in flight
+
+        Args:
+            gid (int): The id of the guild
+            pending (int): The number of downloads waiting
+
+        Raises:
+            AdmissionError: If the download pool or the guild's share of it is backed up
+        """
+        if self._downloads.get(gid, 0) >= self.guild_downloads:
+            self._refuse('Still downloading your last songs!', 'Wait for them to download and try again')
+        if pending >= self.max_pending_downloads:
+            self._refuse('The bot is busy downloading songs!', 'Try again in a minute')
+
+    def check_duration(self, file_data):
+        """Refuses a song that is too long
+
+        Args:
+            file_data (Track): The song
+
+        Raises:
+            AdmissionError: If the song is longer than the limit
+        """
+        if not self.allows_duration(file_data.duration):
+            self._refuse('That song is too long!',
+                         f'Songs can be at most {self.max_track_duration // 60} minutes long')
+
+    def allows_duration(self, duration):
+        """Returns if a song of a length may be queued, songs whose length is unknown are allowed
+
+        Args:
+            duration (float): The length of the song in seconds
+
+        Returns:
+            bool: True if the song is short enough
+        """
+        return not duration or duration <= self.max_track_duration
+
+    def queue_space(self, queued):
+        """Returns the number of songs that can still be added to a queue
+
+        Args:
+            queued (int): The number of songs in the queue
+
+        Returns:
+            int: The number of songs that fit
+        """
+        return max(0, self.max_queue_length - queued)
+
+    @contextmanager
+    def lookup(self, gid):
+        """Holds a lookup slot of a guild and a global one while a search or lookup runs
+
+        Args:
+            gid (int): The id of the guild
+
+        Raises:
+            AdmissionError: If the guild or every guild together already run as many lookups as they may
+        """
+        if self._lookups.get(gid, 0) >= self.guild_lookups:
+            self._refuse('Still looking up your last songs!', 'Wait for them to be queued and try again')
+        if self._running >= self.global_lookups:
+            self._refuse('The bot is busy looking up songs!', 'Try again in a few seconds')
+        self._lookups[gid] = self._lookups.get(gid, 0) + 1
+        self._running += 1
+        self.admitted += 1
+        try:
+            yield
+        finally:
+            self._running -= 1
+            self._lookups[gid] -= 1
+            if self._lookups[gid] == 0:
+                del self._lookups[gid]
+
+    @contextmanager
+    def downloading(self, gid):
+        """Counts a download or lookup of a guild in the download pool while it is in flight, it is never refused
+
+        Args:
+            gid: The id of the guild, or the key of a radio station
+        """
+        self._downloads[gid] = self._downloads.get(gid, 0) + 1
+        try:
+            yield
+        finally:
+            self._downloads[gid] -= 1
+            if self._downloads[gid] == 0:
+                del self._downloads[gid]
+
+    def _refuse(self, title, description=None):
+        """Counts a refused request and raises its error
+
+        Args:
+            title (str): The reason the request was refused
+            description (str, optional): What the user can do about it
+
+        Raises:
+            AdmissionError: Always
+        """
+        self.shed += 1
+        raise AdmissionError(title, description)
+
+    def _forget_users(self, now):
+        """Drops the users that have not sent a command within the window
+
+        Args:
+            now (float): The current monotonic time
+        """
+        self._commands = {user_id: times for user_id, times in self._commands.items()
+                          if times and times[-1] > now - self.command_window}
@@ -0,0 +1,233 @@
+import socket
+import sys
+import threading
+
+import discord
+
+import bot_util as bt
+from audio_node import Connection, KIND_AUDIO, NodeError
+
+
+class LocalBackend:
+    """Plays songs with FFmpeg processes owned by the bot, encoding them in the bot's voice threads if needed
+    """
+
+    def open(self, location, opus, before_options=None):
+        """Opens the audio of a song
+
+        Args:
+            location (str): The path or url of the audio
+            opus (bool): If the audio is an Opus stream that can be sent without re-encoding
+            before_options (str, optional): The options given to FFmpeg before its input
+
+        Returns:
+            discord.AudioSource: The source of the song
+        """
+        if opus:
+            return discord.FFmpegOpusAudio(location, codec='copy', before_options=before_options)
+        return discord.FFmpegPCMAudio(location, before_options=before_options)
+
+    def pause(self, source):
+        """Tells the backend a source was paused, local sources simply stop being read
+
+        Args:
+            source (discord.AudioSource): The paused source
+        """
+
+    def resume(self, source):
+        """Tells the backend a source was resumed
+
+        Args:
+            source (discord.AudioSource): The resumed source
+        """
+
+
+class NodeSource(discord.AudioSource):
+    """The Opus packets of a song played by an audio node
+
+    Attributes:
+        path (str): The socket path of the node
+        ended (bool): If the node reported the end of the song
+    """
+
+    def __init__(self, path, command, timeout=10, on_close=None):
+        """Connects to a node and asks it to play a song, blocking until it has started
+
+        Args:
+            path (str): The socket path of the node
+            command (dict): The play command
+            timeout (float, optional): The number of seconds to wait on the node
+            on_close (optional): Called once the source is cleaned up
+
+        Raises:
+            NodeError: If the node cannot be reached or cannot play the song
+        """
+        self.path = path
+        self.ended = False
+        self._on_close = on_close
+        self._closed = True
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(timeout)
+        self._connection = Connection(sock)
+        try:
+            sock.connect(path)
+            self._connection.send_json(dict(command, op='play'))
+            reply = self._connection.receive()
+        except OSError as e:
+            self._connection.close()
+            raise NodeError(f'Unable to reach the audio node {path}: {e}')
+        if reply is None or reply[1].get('event') != 'started':
+            self._connection.close()
+            message = reply[1].get('message') if reply is not None else 'connection closed'
+            raise NodeError(f'The audio node {path} could not play {command["location"]}: {message}')
+        self._closed = False
+
+    def read(self):
+        """Reads the next packet sent by the node
+
+        Returns:
+            bytes: The Opus packet, empty once the song has ended
+        """
+        if self.ended or self._closed:
+            return b''
+        try:
+            message = self._connection.receive()
+        except OSError:
+            message = None
+        if message is None:
+            bt.WARN(f'The audio node {self.path} closed the connection')
+            self.ended = True
+            return b''
+        kind, payload = message
+        if kind == KIND_AUDIO:
+            return payload
+        if payload.get('event') == 'error':
+            bt.ERROR(f'The audio node {self.path} failed: {payload.get("message")}')
+        self.ended = True
+        return b''
+
+    def is_opus(self):
+        """Returns if the frames are Opus packets
+
+        Returns:
+            bool: Always True, the node does the encoding
+        """
+        return True
+
+    def command(self, op):
+        """Sends a command to the node about the song
+
+        Args:
+            op (str): One of pause, resume or stop
+        """
+        try:
+            self._connection.send_json({'op': op})
+        except OSError:
+            pass
+
+    def cleanup(self):
+        """Stops the song on the node and closes the connection
+        """
+        if self._closed:
+            return
+        self._closed = True
+        if not self.ended:
+            self.command('stop')
+        self._connection.close()
+        if self._on_close is not None:
+            self._on_close(self)
+
+
+class NodeBackend:
+    """Plays songs on separate audio node processes, so FFmpeg and encoding do not share the bot's process
+
+    Each song is played by the node with the fewest songs open. If no node can play it, it is played by
+    the local backend instead so playback carries on.
+
+    Attributes:
+        paths (list): The socket paths of the nodes
+        timeout (float): The number of seconds to wait on a node
+    """
+
+    def __init__(self, paths, timeout=10):
+        """Initialises the backend
+
+        Args:
+            paths (list): The socket paths of the nodes
+            timeout (float, optional): The number of seconds to wait on a node
+        """
+        self.paths = list(paths)
+        self.timeout = timeout
+        self._fallback = LocalBackend()
+        self._open = {path: 0 for path in self.paths}  # dict with structure as : node path: songs open
+        self._lock = threading.Lock()
+
+    def open(self, location, opus, before_options=None):
+        """Opens the audio of a song on a node, this blocks until the node has started it
+
+        Args:
+            location (str): The path or url of the audio
+            opus (bool): If the audio is an Opus stream that can be sent without re-encoding
+            before_options (str, optional): The options given to FFmpeg before its input
+
+        Returns:
+            discord.AudioSource: The source of the song
+        """
+        command = {'location': location, 'opus': opus, 'before_options': before_options}
+        with self._lock:
+            paths = sorted(self.paths, key=lambda path: self._open[path])
+        for path in paths:
+            try:
+                source = NodeSource(path, command, timeout=self.timeout, on_close=self._closed)
+            except NodeError:
+                ex_type, ex_value, ex_traceback = sys.exc_info()
+                bt.WARN(str(ex_value))
+                continue
+            with self._lock:
+                self._open[path] += 1
+            return source
+        bt.WARN(f'No audio node could play {location}, playing it locally')
+        return self._fallback.open(location, opus, before_options)
+
+    def pause(self, source):
+        """Pauses a song on its node
+
+        Args:
+            source (discord.AudioSource): The paused source
+        """
+        if isinstance(source, NodeSource):
+            source.command('pause')
+
+    def resume(self, source):
+        """Resumes a song on its node
+
+        Args:
+            source (discord.AudioSource): The resumed source
+        """
+        if isinstance(source, NodeSource):
+            source.command('resume')
+
+    def _closed(self, source):
+        """Counts a node's song as closed
+
+        Args:
+            source (NodeSource): The closed source
+        """
+        with self._lock:
+            self._open[source.path] -= 1
+
+
+def make_backend(nodes, timeout=10):
+    """Makes the backend songs are played with
+
+    Args:
+        nodes (list): The socket paths of the audio nodes, songs are played locally if there are none
+        timeout (float, optional): The number of seconds to wait on a node
+
+    Returns:
+        LocalBackend or NodeBackend: The backend
+    """
+    if nodes:
+        bt.INFO(f'Playing songs on {len(nodes)} audio nodes')
+        return NodeBackend(nodes, timeout=timeout)
+    return LocalBackend()
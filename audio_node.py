@@ -0,0 +1,229 @@
+"""An audio node, which runs FFmpeg and Opus encoding for the bot in a separate process
+
+Usage: python audio_node.py [socket path]
+
+The bot connects to the node's Unix socket once for every song it plays. It sends a play command,
+and the node streams the song back as Opus packets, followed by an end event. Pause, resume and stop
+commands can be sent while the song plays, and seeking is done by playing the song again from a start
+position. As the node only writes packets as fast as the bot reads them, a paused bot also pauses
+the node.
+
+Every message is framed as a kind byte and a 4 byte big endian length, followed by the payload.
+Commands and events are json objects, audio is a raw Opus packet.
+"""
+import json
+import os
+import socketserver
+import struct
+import sys
+import threading
+
+import discord
+
+import bot_util as bt
+
+DEFAULT_SOCKET = '/tmp/multibot-audio.sock'
+
+KIND_JSON = 0  # A command sent to the node or an event sent by it
+KIND_AUDIO = 1  # An Opus packet
+
+_header = struct.Struct('>BI')
+
+
+class NodeError(Exception):
+    """Raised when a node cannot be reached or cannot play a song
+    """
+
+
+class Connection:
+    """Sends and receives framed messages over a socket
+
+    Attributes:
+        sock (socket.socket): The connected socket
+    """
+
+    def __init__(self, sock):
+        """Wraps a connected socket
+
+        Args:
+            sock (socket.socket): The socket
+        """
+        self.sock = sock
+        self._send_lock = threading.Lock()
+
+    def send(self, kind, payload):
+        """Sends a message, this blocks while the other side is not reading
+
+        Args:
+            kind (int): KIND_JSON or KIND_AUDIO
+            payload (bytes): The payload of the message
+        """
+        with self._send_lock:
+            self.sock.sendall(_header.pack(kind, len(payload)) + payload)
+
+    def send_json(self, data):
+        """Sends a command or an event
+
+        Args:
+            data (dict): The json object to send
+        """
+        self.send(KIND_JSON, json.dumps(data).encode())
+
+    def receive(self):
+        """Receives a message
+
+        Returns:
+            tuple: tuple containing:
+                    int: the kind of the message
+                    bytes or dict: the Opus packet, or the decoded json object
+            None: If the other side closed the connection
+        """
+        header = self._read(_header.size)
+        if header is None:
+            return None
+        kind, length = _header.unpack(header)
+        payload = self._read(length)
+        if payload is None:
+            return None
+        if kind == KIND_JSON:
+            return kind, json.loads(payload)
+        return kind, payload
+
+    def _read(self, length):
+        """Reads exactly length bytes
+
+        Args:
+            length (int): The number of bytes to read
+
+        Returns:
+            bytes: The data read
+            None: If the connection closed first
+        """
+        data = b''
+        while len(data) < length:
+            chunk = self.sock.recv(length - len(data))
+            if not chunk:
+                return None
+            data += chunk
+        return data
+
+    def close(self):
+        """Closes the socket
+        """
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+
+
+class Session:
+    """Plays one song for a connection
+
+    Attributes:
+        command (dict): The play command of the song
+    """
+
+    def __init__(self, connection, command):
+        """Initialises the session
+
+        Args:
+            connection (Connection): The connection to the bot
+            command (dict): The play command, with the location, before_options and opus flag of the song
+        """
+        self.command = command
+        self._connection = connection
+        self._resumed = threading.Event()
+        self._resumed.set()
+        self._stopped = threading.Event()
+
+    def run(self):
+        """Streams the song's packets until it ends or the bot stops it
+        """
+        try:
+            source = discord.FFmpegOpusAudio(self.command['location'],
+                                             codec='copy' if self.command.get('opus') else 'libopus',
+                                             before_options=self.command.get('before_options'))
+        except Exception:
+            ex_type, ex_value, ex_traceback = sys.exc_info()
+            self._connection.send_json({'event': 'error', 'message': str(ex_value)})
+            return
+        threading.Thread(target=self._listen, name='node-commands', daemon=True).start()
+        frames = 0
+        try:
+            self._connection.send_json({'event': 'started'})
+            while not self._stopped.is_set():
+                if not self._resumed.wait(timeout=1):
+                    continue
+                data = source.read()
+                if not data:
+                    self._connection.send_json({'event': 'end', 'frames': frames})
+                    break
+                self._connection.send(KIND_AUDIO, data)
+                frames += 1
+        except OSError:
+            bt.WARN('The bot closed the connection of a song that was still playing')
+        finally:
+            source.cleanup()
+
+    def _listen(self):
+        """Applies the commands the bot sends while the song plays
+        """
+        while True:
+            try:
+                message = self._connection.receive()
+            except OSError:
+                message = None
+            if message is None or message[1].get('op') == 'stop':
+                self._stopped.set()
+                self._resumed.set()
+                return
+            op = message[1].get('op')
+            if op == 'pause':
+                self._resumed.clear()
+            elif op == 'resume':
+                self._resumed.set()
+
+
+class NodeHandler(socketserver.BaseRequestHandler):
+    """Handles a connection from the bot, each connection plays a single song
+    """
+
+    def handle(self):
+        connection = Connection(self.request)
+        message = connection.receive()
+        if message is None:
+            return
+        kind, command = message
+        if kind != KIND_JSON or command.get('op') != 'play':
+            connection.send_json({'event': 'error', 'message': 'The first command must be play'})
+            return
+        Session(connection, command).run()
+
+
+class AudioNode(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """The node's server, every connection is handled on its own thread
+    """
+
+    daemon_threads = True
+
+
+def serve(path=DEFAULT_SOCKET):
+    """Runs a node until it is interrupted
+
+    Args:
+        path (str, optional): The path of the Unix socket to listen on
+    """
+    if os.path.exists(path):
+        os.remove(path)
+    with AudioNode(path, NodeHandler) as node:
+        bt.INFO(f'Audio node listening on {path}')
+        try:
+            node.serve_forever()
+        except KeyboardInterrupt:
+            bt.INFO('Audio node shutting down')
+        finally:
+            os.remove(path)
+
+
+if __name__ == '__main__':
+    serve(sys.argv[1] if len(sys.argv) > 1 else DEFAULT_SOCKET)
@@ -0,0 +1,84 @@
+"""Compares the targeted scan of YouTube search pages with the full BeautifulSoup parse
+
+Usage: python benchmarks/bench_search_parse.py [page.html ...]
+
+With no arguments every page saved in benchmarks/fixtures is used.
+"""
+import glob
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bs4 import BeautifulSoup  # noqa: E402
+
+from bot_util import YoutubeSearch  # noqa: E402
+
+ROUNDS = 20
+
+
+def make_search(max_results=10):
+    """Makes a search object that can parse pages without running a search
+
+    Args:
+        max_results (int, optional): The maximum number of results to return
+
+    Returns:
+        YoutubeSearch: The search object
+    """
+    search = YoutubeSearch.__new__(YoutubeSearch)
+    search.search_terms = ''
+    search.max_results = max_results
+    return search
+
+
+def measure(parse, text):
+    """Measures the time and peak memory used by a parser
+
+    Args:
+        parse: The function parsing the page
+        text (str): The html of the page
+
+    Returns:
+        tuple: tuple containing:
+                float: the mean time of a parse in milliseconds
+                float: the peak memory of a parse in kilobytes
+                int: the number of videos found
+    """
+    tracemalloc.start()
+    results = parse(text)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        parse(text)
+    mean = (time.perf_counter() - start) / ROUNDS
+    return mean * 1000, peak / 1024, len(results)
+
+
+def main(files):
+    """Runs the benchmark on every page
+
+    Args:
+        files (list): The paths of the saved search pages
+    """
+    search = make_search(max_results=None)
+    parsers = {
+        'beautifulsoup': lambda text: search.parse_html(BeautifulSoup(text, 'html.parser')),
+        'scan': search.extract_results,
+    }
+    print(f'{"page":<32}{"parser":<16}{"ms":>10}{"peak KB":>12}{"videos":>8}')
+    for file in files:
+        with open(file, 'r', encoding='utf-8') as f:
+            text = f.read()
+        for name, parse in parsers.items():
+            mean, peak, found = measure(parse, text)
+            print(f'{os.path.basename(file):<32}{name:<16}{mean:>10.2f}{peak:>12.0f}{found:>8}')
+
+
+if __name__ == '__main__':
+    pages = sys.argv[1:] or sorted(glob.glob(os.path.join(os.path.dirname(__file__), 'fixtures', '*.html')))
+    main(pages)
@@ -1,10 +1,18 @@
+import asyncio
+import html
 import inspect
 import json
+import re
+import threading
+import time
 import urllib.parse
+from collections import OrderedDict
 
+import aiohttp
 import discord
 import requests
 from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
 
 
 class bcolours:
@@ -20,6 +28,139 @@ class bcolours:
     UNDERLINE = '\033[4m'
 
 
+class SearchCache:
+    """A bounded cache of YouTube search results that is shared by every guild
+    
+    Queries are normalised so that differences in case, spacing and punctuation share an entry.
+    Empty results are kept for a shorter time so that failing searches are not repeated straight away.
+    
+    Attributes:
+        max_entries (int): The number of queries kept before the least recently used is dropped
+        ttl (int): The number of seconds results are kept for
+        negative_ttl (int): The number of seconds empty results are kept for
+    """
+
+    def __init__(self, max_entries=512, ttl=86400, negative_ttl=300):
+        """Initialises the search cache
+        
+        Args:
+            max_entries (int, optional): The number of queries kept before the least recently used is dropped
+            ttl (int, optional): The number of seconds results are kept for
+            negative_ttl (int, optional): The number of seconds empty results are kept for
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._entries = OrderedDict()  # dict with structure as : key: (expiry, results)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def normalise(query):
+        """Normalises a search query
+        
+        Args:
+            query (str): The search terms
+        
+        Returns:
+            str: The lower case search terms without punctuation or repeated whitespace
+        """
+        return ' '.join(re.sub(r'[^\w\s]', ' ', query.lower()).split())
+
+    def get(self, query, max_results=None):
+        """Gets the cached results of a query
+        
+        Args:
+            query (str): The search terms
+            max_results (None, optional): The maximum number of results the search returned
+        
+        Returns:
+            list: The cached results, empty if the query recently found nothing
+            None: If the query is not cached
+        """
+        key = (self.normalise(query), max_results)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return list(entry[1])
+
+    def put(self, query, results, max_results=None):
+        """Caches the results of a query
+        
+        Args:
+            query (str): The search terms
+            results (list): The results of the search
+            max_results (None, optional): The maximum number of results the search returned
+        """
+        key = (self.normalise(query), max_results)
+        ttl = self.ttl if len(results) > 0 else self.negative_ttl
+        with self._lock:
+            self._entries[key] = (time.time() + ttl, list(results))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+search_cache = SearchCache()
+
+_json_decoder = json.JSONDecoder()
+_anchor_pattern = re.compile(r'<a\s[^>]*yt-uix-tile-link[^>]*>')
+_href_pattern = re.compile(r'\shref="([^"]*)"')
+_title_pattern = re.compile(r'\stitle="([^"]*)"')
+
+#------------------------------------HTTP Sessions---------------------------------------
+
+HTTP_TIMEOUT = 10  # The number of seconds a request to YouTube may take
+HTTP_CONNECTIONS = 20  # The number of connections kept open to YouTube
+
+_requests_session = None
+_aiohttp_session = None
+
+
+def get_requests_session():
+    """Gets the shared requests session, keeping connections alive between blocking searches
+    
+    Returns:
+        requests.Session: The shared session
+    """
+    global _requests_session
+    if _requests_session is None:
+        _requests_session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=HTTP_CONNECTIONS, pool_maxsize=HTTP_CONNECTIONS)
+        _requests_session.mount('https://', adapter)
+        _requests_session.mount('http://', adapter)
+    return _requests_session
+
+
+def get_http_session():
+    """Gets the shared aiohttp session, keeping connections alive between searches on the event loop
+    
+    Returns:
+        aiohttp.ClientSession: The shared session
+    """
+    global _aiohttp_session
+    if _aiohttp_session is None or _aiohttp_session.closed:
+        connector = aiohttp.TCPConnector(limit=HTTP_CONNECTIONS, keepalive_timeout=60, ttl_dns_cache=300)
+        _aiohttp_session = aiohttp.ClientSession(connector=connector,
+                                                 timeout=aiohttp.ClientTimeout(total=HTTP_TIMEOUT))
+    return _aiohttp_session
+
+
+async def close_http_session():
+    """Closes the shared aiohttp session
+    """
+    global _aiohttp_session
+    if _aiohttp_session is not None and not _aiohttp_session.closed:
+        await _aiohttp_session.close()
+    _aiohttp_session = None
+
+#----------------------------------------------------------------------------------------
+
+
 class YoutubeSearch:
     """The YouTube search query
     
@@ -29,34 +170,195 @@ class YoutubeSearch:
         videos (list): The list of videos obtained
     """
 
-    def __init__(self, search_terms: str, max_results=None):
-        """Runs the search on YouTube
+    def __init__(self, search_terms: str, max_results=None, use_cache=True):
+        """Runs the search on YouTube, unless it was recently run before
+        
+        Args:
+            search_terms (str): The search terms to be used on YouTube
+            max_results (None, optional): The maximum number of results to return
+            use_cache (bool, optional): If cached results may be returned instead of searching again
+        """
+        self.search_terms = search_terms
+        self.max_results = max_results
+        self.videos = search_cache.get(search_terms, max_results) if use_cache else None
+        if self.videos is None:
+            self.videos = self.search()
+            search_cache.put(search_terms, self.videos, max_results)
+
+    @classmethod
+    async def create(cls, search_terms: str, max_results=None, use_cache=True):
+        """Runs the search on YouTube without blocking the event loop, unless it was recently run before
         
         Args:
             search_terms (str): The search terms to be used on YouTube
             max_results (None, optional): The maximum number of results to return
+            use_cache (bool, optional): If cached results may be returned instead of searching again
+        
+        Returns:
+            YoutubeSearch: The finished search
         """
+        self = cls.__new__(cls)
         self.search_terms = search_terms
         self.max_results = max_results
-        self.videos = self.search()
+        self.videos = search_cache.get(search_terms, max_results) if use_cache else None
+        if self.videos is None:
+            self.videos = await self.search_async()
+            search_cache.put(search_terms, self.videos, max_results)
+        return self
+
+    @property
+    def url(self):
+        """Returns the url of the search results page
+        
+        Returns:
+            str: The url of the search
+        """
+        encoded_search = urllib.parse.quote(self.search_terms)
+        BASE_URL = "https://youtube.com"
+        return f"{BASE_URL}/results?search_query={encoded_search}"
 
     def search(self):
         """Performs the actual search 
         
         Returns:
             list: The list of videos found on YouTube from the given query 
+        
+        Raises:
+            requests.HTTPError: If YouTube answers with an error, such as when it throttles searches
         """
-        encoded_search = urllib.parse.quote(self.search_terms)
-        BASE_URL = "https://youtube.com"
-        url = f"{BASE_URL}/results?search_query={encoded_search}"
-        INFO(url)
-        response = BeautifulSoup(requests.get(url).text, "html.parser")
-        results = self.parse_html(response)
+        INFO(self.url)
+        response = get_requests_session().get(self.url, timeout=HTTP_TIMEOUT)
+        response.raise_for_status()
         INFO('Got response from YouTube')
+        return self.parse_page(response.text)
+
+    async def search_async(self):
+        """Performs the actual search on the shared aiohttp session, parsing the page off the event loop
+        
+        Returns:
+            list: The list of videos found on YouTube from the given query
+        
+        Raises:
+            aiohttp.ClientResponseError: If YouTube answers with an error, such as when it throttles searches
+        """
+        INFO(self.url)
+        async with get_http_session().get(self.url) as response:
+            response.raise_for_status()
+            text = await response.text()
+        INFO('Got response from YouTube')
+        return await asyncio.get_running_loop().run_in_executor(None, self.parse_page, text)
+
+    def parse_page(self, text):
+        """Parses the search results page and trims the results to max_results
+        
+        Args:
+            text (str): The html of the search results page
+        
+        Returns:
+            list: The list of videos found on the page
+        """
+        results = self.extract_results(text)
+        if len(results) == 0:
+            WARN('Falling back to a full parse of the search results page')
+            results = self.parse_html(BeautifulSoup(text, "html.parser"))
         if self.max_results is not None and len(results) > self.max_results:
             return results[:self.max_results]
         return results
 
+    def extract_results(self, text):
+        """Finds the videos on the page by scanning for them, without building the whole document tree
+        
+        Args:
+            text (str): The html of the search results page
+        
+        Returns:
+            list: A list of all the videos found, empty if the page layout was not recognised
+        """
+        results = self.scan_initial_data(text)
+        if len(results) == 0:
+            results = self.scan_anchors(text)
+        return results
+
+    def scan_initial_data(self, text):
+        """Finds the videos in the json data that YouTube embeds in the page
+        
+        Args:
+            text (str): The html of the search results page
+        
+        Returns:
+            list: A list of the videos found in the embedded json
+        """
+        results = []
+        seen = set()
+        marker = '"videoRenderer":{"videoId":"'
+        position = text.find(marker)
+        while position != -1 and not self._enough(results):
+            start = position + len(marker)
+            video_id = text[start:start + 11]
+            position = text.find(marker, start)
+            end = position if position != -1 else len(text)
+            title = self._find_json_title(text, start, end)
+            if title is not None and video_id not in seen:
+                seen.add(video_id)
+                results.append({"title": title, "link": f"/watch?v={video_id}", "id": video_id})
+        return results
+
+    def scan_anchors(self, text):
+        """Finds the videos in the result links of the page
+        
+        Args:
+            text (str): The html of the search results page
+        
+        Returns:
+            list: A list of the videos found in the links
+        """
+        results = []
+        for anchor in _anchor_pattern.finditer(text):
+            if self._enough(results):
+                break
+            tag = anchor.group(0)
+            href = _href_pattern.search(tag)
+            title = _title_pattern.search(tag)
+            if href is None or title is None or not href.group(1).startswith("/watch?v="):
+                continue
+            link = html.unescape(href.group(1))
+            results.append({"title": html.unescape(title.group(1)), "link": link, "id": link[link.index("=") + 1:]})
+        return results
+
+    def _enough(self, results):
+        """Checks if the scan has found as many videos as are needed
+        
+        Args:
+            results (list): The videos found so far
+        
+        Returns:
+            bool: True if no more videos are needed
+        """
+        return self.max_results is not None and len(results) >= self.max_results
+
+    @staticmethod
+    def _find_json_title(text, start, end):
+        """Reads the title of a video renderer in the embedded json
+        
+        Args:
+            text (str): The html of the search results page
+            start (int): The position of the video renderer
+            end (int): The position of the next video renderer
+        
+        Returns:
+            str: The title of the video
+            None: If the renderer has no title
+        """
+        for marker in ('"title":{"runs":[{"text":', '"title":{"simpleText":'):
+            position = text.find(marker, start, end)
+            if position != -1:
+                try:
+                    title, _ = _json_decoder.raw_decode(text, position + len(marker))
+                    return title
+                except ValueError:
+                    return None
+        return None
+
     def parse_html(self, soup):
         """Finds the urls of the videos in the html
         
@@ -94,6 +396,22 @@ class YoutubeSearch:
         return json.dumps({"videos": self.videos})
 
 
+def get_video_id(url):
+    """Gets the YouTube video id out of a url without making any requests
+    
+    Args:
+        url (str): The url of the video
+    
+    Returns:
+        str: The id of the video
+        None: If the url is not a YouTube video url
+    """
+    match = re.search(r'(?:youtube\.com/(?:watch\?(?:.*&)?v=|embed/|shorts/)|youtu\.be/)([A-Za-z0-9_-]{11})', url)
+    if match is None:
+        return None
+    return match.group(1)
+
+
 def embed_message(title, colour=None, description='', footer=''):
     """Creates a discord embedded message with some formatting
     
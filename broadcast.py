@@ -0,0 +1,194 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import discord
+from discord import opus
+
+from player import FRAME_SECONDS
+from tracks import TrackQueue
+
+OPUS_SILENCE = b'\xf8\xff\xfe'  # An Opus packet of silence, sent to listeners while the station has nothing new
+
+
+class BroadcastChannel:
+    """A radio station whose songs are decoded and encoded once for any number of listening guilds
+
+    A single thread pumps the station's songs in real time, turns every frame into an Opus packet once
+    and keeps the latest packets in a ring. Each listening voice client plays a BroadcastSubscriber
+    reading packets from that ring, so adding listeners adds no FFmpeg processes and no encoding. The
+    pump waits while nobody is listening.
+
+    Attributes:
+        name (str): The name of the station
+        queue (TrackQueue): The songs of the station, the first song is the one playing
+        repeat (bool): If songs are queued again once they have played
+        closed (bool): If the station has been stopped
+        sequence (int): The number of packets the station has sent
+        executor (ThreadPoolExecutor): The single thread the station's songs are pumped on
+    """
+
+    def __init__(self, name, tracks=(), repeat=True, ring_size=50):
+        """Initialises the station
+
+        Args:
+            name (str): The name of the station
+            tracks (iterable, optional): The songs of the station
+            repeat (bool, optional): If songs are queued again once they have played
+            ring_size (int, optional): The number of packets kept for listeners that fall behind
+        """
+        self.name = name
+        self.queue = TrackQueue(tracks)
+        self.repeat = repeat
+        self.closed = False
+        self.sequence = 0
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f'radio-{name}')
+        self._ring = [None] * ring_size
+        self._subscribers = set()
+        self._encoder = None
+        self._condition = threading.Condition()
+
+    @property
+    def now_playing(self):
+        """Returns the song the station is playing
+
+        Returns:
+            Track: The song being played
+            None: If the station has no songs
+        """
+        if len(self.queue) == 0:
+            return None
+        return self.queue[0]
+
+    @property
+    def listeners(self):
+        """Returns the number of voice clients listening to the station
+
+        Returns:
+            int: The number of subscribers
+        """
+        return len(self._subscribers)
+
+    def subscribe(self):
+        """Makes a source that plays the station live from its latest packet
+
+        Returns:
+            BroadcastSubscriber: The source to give to a voice client
+        """
+        subscriber = BroadcastSubscriber(self)
+        with self._condition:
+            self._subscribers.add(subscriber)
+            self._condition.notify_all()
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        """Stops sending the station to a subscriber
+
+        Args:
+            subscriber (BroadcastSubscriber): The subscriber leaving
+        """
+        with self._condition:
+            self._subscribers.discard(subscriber)
+            self._condition.notify_all()
+
+    def pump(self, source):
+        """Sends the frames of a song to the listeners in real time, this blocks until the song ends
+
+        Args:
+            source (discord.AudioSource): The source of the song
+
+        Returns:
+            bool: True if the song ended, False if the station was stopped
+        """
+        start = time.perf_counter()
+        sent = 0
+        while True:
+            with self._condition:
+                if not self._subscribers and not self.closed:
+                    self._condition.wait_for(lambda: self._subscribers or self.closed)
+                    start = time.perf_counter()
+                    sent = 0
+                if self.closed:
+                    return False
+            data = source.read()
+            if not data:
+                return True
+            if not source.is_opus():
+                if self._encoder is None:
+                    self._encoder = opus.Encoder()
+                data = self._encoder.encode(data, opus.Encoder.SAMPLES_PER_FRAME)
+            with self._condition:
+                self._ring[self.sequence % len(self._ring)] = data
+                self.sequence += 1
+                self._condition.notify_all()
+            sent += 1
+            delay = start + sent * FRAME_SECONDS - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+    def read_after(self, position, timeout=FRAME_SECONDS * 5):
+        """Waits for the packet at a position, skipping ahead if the reader fell out of the ring
+
+        Args:
+            position (int): The sequence number of the packet to read
+            timeout (float, optional): The number of seconds to wait before returning silence
+
+        Returns:
+            tuple: tuple containing:
+                    bytes: the packet, silence if none arrived in time, empty once the station is stopped
+                    int: the position of the packet to read next
+        """
+        with self._condition:
+            if not self._condition.wait_for(lambda: self.sequence > position or self.closed, timeout):
+                return OPUS_SILENCE, position
+            if self.closed:
+                return b'', position
+            position = max(position, self.sequence - len(self._ring))
+            return self._ring[position % len(self._ring)], position + 1
+
+    def close(self):
+        """Stops the station, its listeners' sources end and the pump returns
+        """
+        with self._condition:
+            self.closed = True
+            self._condition.notify_all()
+        self.executor.shutdown(wait=False)
+
+
+class BroadcastSubscriber(discord.AudioSource):
+    """The source a voice client plays to listen to a station
+
+    Attributes:
+        channel (BroadcastChannel): The station listened to
+    """
+
+    def __init__(self, channel):
+        """Starts listening from the station's latest packet
+
+        Args:
+            channel (BroadcastChannel): The station to listen to
+        """
+        self.channel = channel
+        self._position = channel.sequence
+
+    def read(self):
+        """Reads the next packet of the station
+
+        Returns:
+            bytes: The Opus packet, empty once the station is stopped
+        """
+        data, self._position = self.channel.read_after(self._position)
+        return data
+
+    def is_opus(self):
+        """Returns if the frames are Opus packets
+
+        Returns:
+            bool: Always True, the station encodes its frames once for every listener
+        """
+        return True
+
+    def cleanup(self):
+        """Stops listening to the station
+        """
+        self.channel.unsubscribe(self)
@@ -0,0 +1,334 @@
+import asyncio
+import contextlib
+import itertools
+import queue
+import sys
+import threading
+
+import bot_util as bt
+
+PRIORITY_NOW = 0  # A song that has to start playing as soon as it is ready
+PRIORITY_NEXT = 1  # A song that is close to the front of a queue
+PRIORITY_LATER = 2  # A song further back in a queue
+PRIORITY_IDLE = 3  # Background work that nobody is waiting on
+
+
+def _set_result(future, result):
+    """Sets the result of a future unless it was cancelled while the job ran
+
+    Args:
+        future (asyncio.Future): The future to resolve
+        result: The value returned by the job
+    """
+    if not future.done():
+        future.set_result(result)
+
+
+def _set_exception(future, exception):
+    """Sets the exception of a future unless it was cancelled while the job ran
+
+    Args:
+        future (asyncio.Future): The future to resolve
+        exception (BaseException): The exception raised by the job
+    """
+    if not future.done():
+        future.set_exception(exception)
+
+
+def _retrieve(future):
+    """Marks the exception of a shared call as retrieved, as its waiters may all have been cancelled
+
+    Args:
+        future (asyncio.Future): The future of the call
+    """
+    if not future.cancelled():
+        future.exception()
+
+
+class SingleFlight:
+    """Shares one run of a call between everyone that asks for the same key while it is running
+
+    The first caller for a key starts the call and later callers wait on the same result, or the
+    same exception. A waiter that is cancelled does not cancel the call for the others.
+    """
+
+    def __init__(self):
+        """Initialises the registry of running calls
+        """
+        self._calls = {}  # dict with structure as : key: future
+
+    def __contains__(self, key):
+        return key in self._calls
+
+    def __len__(self):
+        return len(self._calls)
+
+    async def run(self, key, fn, *args, **kwargs):
+        """Runs a coroutine function unless a call with the same key is already running, then waits for it
+
+        Args:
+            key: The key identifying the call, such as a video id
+            fn: The coroutine function to call
+            *args: The positional arguments of fn
+            **kwargs: The keyword arguments of fn
+
+        Returns:
+            The value returned by the shared call
+        """
+        call = self._calls.get(key)
+        if call is None:
+            call = asyncio.ensure_future(fn(*args, **kwargs))
+            self._calls[key] = call
+            call.add_done_callback(_retrieve)
+            call.add_done_callback(lambda _: self._forget(key, call))
+        return await asyncio.shield(call)
+
+    def _forget(self, key, call):
+        """Removes a finished call from the registry
+
+        Args:
+            key: The key of the call
+            call (asyncio.Future): The finished call
+        """
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+
+class DownloadPool:
+    """A bounded pool of threads that runs blocking searches and downloads off the event loop
+
+    Jobs are picked up in order of priority, so a song that has to start playing now
+    overtakes the songs that are only being fetched for later in a queue.
+
+    Attributes:
+        max_workers (int): The number of jobs that can run at once
+    """
+
+    def __init__(self, max_workers=2):
+        """Starts the worker threads of the pool
+
+        Args:
+            max_workers (int, optional): The number of jobs that can run at once
+        """
+        self.max_workers = max(1, int(max_workers))
+        self._jobs = queue.PriorityQueue()
+        self._counter = itertools.count()
+        self._closed = False
+        self._threads = []
+        for i in range(self.max_workers):
+            thread = threading.Thread(target=self._work, name=f'download-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        bt.INFO(f'Started download pool with {self.max_workers} workers')
+
+    @property
+    def pending(self):
+        """Returns the number of jobs waiting for a worker
+
+        Returns:
+            int: The number of queued jobs
+        """
+        return self._jobs.qsize()
+
+    def submit(self, priority, fn, *args, **kwargs):
+        """Queues a blocking call to be run by the pool
+
+        Args:
+            priority (int): One of the PRIORITY_ values, lower runs first
+            fn: The blocking function to call
+            *args: The positional arguments of fn
+            **kwargs: The keyword arguments of fn
+
+        Returns:
+            asyncio.Future: A future holding the result of fn
+        """
+        if self._closed:
+            raise RuntimeError('The download pool has been shut down')
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._jobs.put((priority, next(self._counter), fn, args, kwargs, future, loop))
+        return future
+
+    async def run(self, priority, fn, *args, **kwargs):
+        """Runs a blocking call in the pool and waits for its result without blocking the loop
+
+        Args:
+            priority (int): One of the PRIORITY_ values, lower runs first
+            fn: The blocking function to call
+            *args: The positional arguments of fn
+            **kwargs: The keyword arguments of fn
+
+        Returns:
+            The value returned by fn
+        """
+        return await self.submit(priority, fn, *args, **kwargs)
+
+    def shutdown(self):
+        """Stops the workers and cancels every job that has not started yet
+        """
+        self._closed = True
+        while True:
+            try:
+                item = self._jobs.get_nowait()
+            except queue.Empty:
+                break
+            future, loop = item[5], item[6]
+            if future is not None:
+                loop.call_soon_threadsafe(future.cancel)
+        for _ in self._threads:
+            self._jobs.put((-1, next(self._counter), None, (), {}, None, None))
+        bt.INFO('Shut down download pool')
+
+    def _work(self):
+        """The loop run by each worker thread
+        """
+        while True:
+            priority, _, fn, args, kwargs, future, loop = self._jobs.get()
+            if fn is None:
+                return
+            if future.cancelled():
+                continue
+            try:
+                result = fn(*args, **kwargs)
+            except BaseException as e:
+                ex_type, ex_value, ex_traceback = sys.exc_info()
+                bt.WARN(f'Download job failed with priority {priority}: {ex_value}')
+                loop.call_soon_threadsafe(_set_exception, future, e)
+            else:
+                loop.call_soon_threadsafe(_set_result, future, result)
+
+
+class Prefetcher:
+    """Downloads the songs near the front of each guild's queue in the background
+
+    The song at the front of a queue is fetched first, then as many of the following
+    songs as fit in the guild's byte budget, up to depth songs ahead. Guilds that queue
+    the same song at the same time, or a guild that queues it twice, share a single download
+    of it, and every queued copy of the song is marked ready once it finishes.
+
+    Attributes:
+        depth (int): How many songs after the current one are downloaded ahead of time
+        budget (int): The number of bytes of upcoming songs a guild may hold ahead of time
+    """
+
+    def __init__(self, pool, download, depth=3, budget=100_000_000, on_ready=None, slot=None):
+        """Initialises the prefetcher
+
+        Args:
+            pool (DownloadPool): The pool the downloads are run in
+            download: The blocking function that downloads a song given its track, returning its path and size
+            depth (int, optional): How many songs after the current one are downloaded ahead of time
+            budget (int, optional): The number of bytes of upcoming songs a guild may hold ahead of time
+            on_ready (optional): A function called on the event loop each time a download finishes
+            slot (optional): A function given a guild id that returns a context manager held while the guild's
+                download is in flight
+        """
+        self._pool = pool
+        self._download = download
+        self._on_ready = on_ready
+        self._slot = slot or (lambda gid: contextlib.nullcontext())
+        self.depth = depth
+        self.budget = budget
+        self._tasks = {}  # dict with structure as : guild id: {Track: task}, a song queued twice has two tasks
+        self._downloads = SingleFlight()
+
+    def update(self, gid, songs):
+        """Starts the downloads needed for the front of a guild's queue
+
+        Args:
+            gid (int): The id of the guild that owns the queue
+            songs (TrackQueue): The queue, the first song is the one playing
+        """
+        tasks = self._tasks.setdefault(gid, {})
+        used = 0
+        for index, song in enumerate(songs[:self.depth + 1]):
+            if index > 0 and used + song.size > self.budget:
+                break
+            if index > 0:
+                used += song.size
+            if song.ready or song.failed or song in tasks:
+                continue
+            priority = PRIORITY_NOW if index == 0 else PRIORITY_NEXT if index == 1 else PRIORITY_LATER
+            tasks[song] = asyncio.create_task(self._fetch(gid, song, priority))
+
+    async def wait(self, gid, song):
+        """Waits for a song to be downloaded, downloading it right away if it was not prefetched
+
+        Args:
+            gid (int): The id of the guild that needs the song
+            song (Track): The song
+
+        Returns:
+            bool: True if the song is ready to be played, False if the download failed
+        """
+        if song.ready:
+            return True
+        if song.failed:
+            return False
+        tasks = self._tasks.setdefault(gid, {})
+        task = tasks.get(song)
+        if task is None:
+            task = asyncio.create_task(self._fetch(gid, song, PRIORITY_NOW))
+            tasks[song] = task
+        try:
+            await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if task.cancelled():
+                return False
+            raise
+        return song.ready
+
+    async def warm(self, song):
+        """Downloads a song that no guild has queued, sharing the download with any guild that queues it meanwhile
+
+        Args:
+            song (Track): The song
+
+        Returns:
+            bool: True if the song was downloaded
+        """
+        try:
+            song.file, song.size = await self._downloads.run(song.id, self._pool.run, PRIORITY_IDLE, self._download,
+                                                             song)
+        except Exception:
+            ex_type, ex_value, ex_traceback = sys.exc_info()
+            bt.ERROR(f'Unable to download {song.title} ahead of time: {ex_value}')
+            return False
+        song.ready = True
+        if self._on_ready is not None:
+            self._on_ready()
+        return True
+
+    def clear(self, gid):
+        """Cancels the downloads that have not started for a guild
+
+        Args:
+            gid (int): The id of the guild whose queue was cleared
+        """
+        for task in self._tasks.pop(gid, {}).values():
+            task.cancel()
+
+    async def _fetch(self, gid, song, priority):
+        """Downloads a song in the pool and marks it as ready, or as failed so that it is not downloaded again
+
+        Args:
+            gid (int): The id of the guild that queued the song
+            song (Track): The song
+            priority (int): The priority of the download in the pool
+        """
+        try:
+            with self._slot(gid):
+                song.file, song.size = await self._downloads.run(song.id, self._pool.run, priority, self._download,
+                                                                 song)
+        except Exception:
+            ex_type, ex_value, ex_traceback = sys.exc_info()
+            bt.ERROR(f'Unable to download {song.title}: {ex_value}')
+            song.failed = True
+        else:
+            song.ready = True
+            if self._on_ready is not None:
+                self._on_ready()
+        finally:
+            tasks = self._tasks.get(gid)
+            if tasks is not None and tasks.get(song) is asyncio.current_task():
+                del tasks[song]
@@ -0,0 +1,177 @@
+import heapq
+import os
+import statistics
+import struct
+import threading
+import time
+from collections import deque
+
+import bot_util as bt
+
+_header = struct.Struct('>dQfB')  # The timestamp, guild id, seconds to start and id length of a play, then the id
+
+
+class PlayHistory:
+    """An append-only log of the songs played in every guild, and how popular each song is
+
+    Each play is appended to a binary log as a small fixed size header followed by the song's id. A song's
+    popularity is its number of plays, each one counting half as much every half_life seconds, so songs that
+    stop being played fade out of the top. The scores are rebuilt from the log when it is loaded, and plays
+    that are too old to count are dropped from the log at the same time.
+
+    Attributes:
+        file (str): The file the log is saved in
+        half_life (float): The number of seconds after which a play counts half as much
+        plays (int): The number of plays in the log
+    """
+
+    retention = 10  # The number of half lives after which a play is dropped from the log
+    rebase_after = 64  # The number of half lives after which the scores are brought back to the current time
+    recent_starts = 100  # The number of plays the time to start is summarised over
+
+    def __init__(self, file, half_life=604800):
+        """Loads the log and opens it for appending
+
+        Args:
+            file (str): The file the log is saved in
+            half_life (float, optional): The number of seconds after which a play counts half as much
+        """
+        self.file = file
+        self.half_life = half_life
+        self.plays = 0
+        self._lock = threading.Lock()
+        self._epoch = time.time()
+        self._scores = {}  # dict with structure as : song id: plays weighted by 2 ** ((time - epoch) / half_life)
+        self._starts = deque(maxlen=self.recent_starts)
+        self._load()
+        self._file = open(file, 'ab')
+        bt.INFO(f'Loaded the play history with {self.plays} plays of {len(self._scores)} songs')
+
+    def _load(self):
+        """Rebuilds the scores from the log, rewriting it without the plays too old to count or a torn last record
+        """
+        try:
+            with open(self.file, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return
+        except OSError:
+            bt.ERROR(f'Unable to read the play history {self.file}, starting a new one')
+            data = b''
+        plays = []
+        offset = 0
+        while offset + _header.size <= len(data):
+            timestamp, gid, wait, length = _header.unpack_from(data, offset)
+            end = offset + _header.size + length
+            if end > len(data):
+                break
+            try:
+                song_id = data[offset + _header.size:end].decode()
+            except UnicodeDecodeError:
+                break
+            plays.append((timestamp, gid, song_id, wait))
+            offset = end
+        cutoff = self._epoch - self.retention * self.half_life
+        kept = [play for play in plays if play[0] >= cutoff]
+        if offset < len(data) or len(kept) < len(plays):
+            bt.INFO(f'Compacting the play history, dropping {len(plays) - len(kept)} old plays')
+            temp = self.file + '.tmp'
+            with open(temp, 'wb') as f:
+                f.write(b''.join(self._pack(*play) for play in kept))
+            os.replace(temp, self.file)
+        for timestamp, gid, song_id, wait in kept:
+            self._count(song_id, timestamp, wait)
+
+    @staticmethod
+    def _pack(timestamp, gid, song_id, wait):
+        """Encodes a play as a record of the log
+
+        Args:
+            timestamp (float): The time the song started
+            gid (int): The id of the guild the song was played in
+            song_id (str): The id of the song
+            wait (float): The number of seconds the song took to start
+
+        Returns:
+            bytes: The record
+        """
+        key = song_id.encode()
+        return _header.pack(timestamp, gid, wait, len(key)) + key
+
+    def _count(self, song_id, timestamp, wait):
+        """Adds a play to the scores
+
+        Args:
+            song_id (str): The id of the song
+            timestamp (float): The time the song started
+            wait (float): The number of seconds the song took to start
+        """
+        exponent = (timestamp - self._epoch) / self.half_life
+        if exponent > self.rebase_after:
+            factor = 2 ** -exponent
+            self._scores = {key: score * factor for key, score in self._scores.items()}
+            self._epoch = timestamp
+            exponent = 0
+        self._scores[song_id] = self._scores.get(song_id, 0) + 2 ** exponent
+        self._starts.append(wait)
+        self.plays += 1
+
+    def record(self, gid, song_id, wait):
+        """Appends a play to the log
+
+        Args:
+            gid (int): The id of the guild the song was played in
+            song_id (str): The id of the song
+            wait (float): The number of seconds the song took to start
+        """
+        timestamp = time.time()
+        with self._lock:
+            try:
+                self._file.write(self._pack(timestamp, gid, song_id, wait))
+                self._file.flush()
+            except OSError:
+                bt.ERROR(f'Unable to write to the play history {self.file}')
+            self._count(song_id, timestamp, wait)
+
+    def popularity(self, song_id):
+        """Returns how popular a song is
+
+        Args:
+            song_id (str): The id of the song
+
+        Returns:
+            float: The number of plays of the song, each counting half as much every half life since it was played
+        """
+        with self._lock:
+            return self._scores.get(song_id, 0) * 2 ** ((self._epoch - time.time()) / self.half_life)
+
+    def top(self, count, accept=None):
+        """Lists the most popular songs
+
+        Args:
+            count (int): The number of songs listed
+            accept (optional): A function given a song id that returns False for songs to leave out
+
+        Returns:
+            list: The ids of the songs, most popular first
+        """
+        with self._lock:
+            scores = [(score, song_id) for song_id, score in self._scores.items() if accept is None or accept(song_id)]
+        return [song_id for score, song_id in heapq.nlargest(count, scores)]
+
+    @property
+    def stats(self):
+        """Returns the counters of the history
+
+        Returns:
+            dict: The number of plays, the number of songs played and the median seconds the recent plays took to start
+        """
+        with self._lock:
+            start = statistics.median(self._starts) if self._starts else None
+            return {'plays': self.plays, 'songs': len(self._scores), 'start': start}
+
+    def close(self):
+        """Closes the log
+        """
+        with self._lock:
+            self._file.close()
@@ -0,0 +1,250 @@
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import mutagen
+except ImportError:
+    mutagen = None
+
+import bot_util as bt
+from song_cache import write_json
+from tracks import Track
+
+audio_extensions = ('.mp3', '.flac', '.ogg', '.opus', '.m4a', '.wav', '.webm')  # The files the library indexes
+local_prefix = 'local-'  # The start of the id of every library song, so they never collide with YouTube ids
+
+
+def is_local(song):
+    """Returns if a song comes from the local library
+
+    Args:
+        song (Track): The song
+
+    Returns:
+        bool: True if the song is a library file
+    """
+    return song.id.startswith(local_prefix)
+
+
+def read_tags(path):
+    """Reads the tags and duration of an audio file, this runs in the indexer's worker processes
+
+    The tags are read with mutagen if it is installed, then with ffprobe, and if neither can read them the
+    title and artist are taken from a file name such as 'Artist - Title.mp3'.
+
+    Args:
+        path (str): The path of the file
+
+    Returns:
+        dict: The title, artist, track, duration and codec of the file
+    """
+    tags = {}
+    duration = None
+    codec = None
+    if mutagen is not None:
+        try:
+            audio = mutagen.File(path, easy=True)
+            if audio is not None:
+                tags = {key: values[0] for key, values in (audio.tags or {}).items() if values}
+                duration = audio.info.length
+                codec = 'opus' if type(audio).__name__ == 'OggOpus' else None
+        except Exception:
+            tags = {}
+    if duration is None:
+        try:
+            probe = subprocess.run(['ffprobe', '-v', 'quiet', '-print_format', 'json', '-show_format',
+                                    '-show_streams', '-select_streams', 'a:0', path],
+                                   capture_output=True, timeout=30, check=True)
+            data = json.loads(probe.stdout)
+            tags = {key.lower(): value for key, value in data['format'].get('tags', {}).items()}
+            duration = float(data['format']['duration'])
+            codec = data['streams'][0].get('codec_name') if data.get('streams') else None
+        except (OSError, ValueError, KeyError, subprocess.SubprocessError):
+            pass
+    name = os.path.splitext(os.path.basename(path))[0]
+    artist, _, title = name.rpartition(' - ')
+    title = tags.get('title') or title.strip()
+    artist = tags.get('artist') or artist.strip() or None
+    return {'title': title, 'artist': artist, 'track': tags.get('title') or (title if artist else None),
+            'duration': int(duration) if duration else None, 'codec': codec}
+
+
+def _read_batch(files):
+    """Reads the tags of a batch of files in a worker process
+
+    Args:
+        files (list): The (path, mtime, size) of each file
+
+    Returns:
+        list: The (path, record) of each file, the record is None if the file could not be read
+    """
+    records = []
+    for path, mtime, size in files:
+        try:
+            record = read_tags(path)
+        except Exception:
+            record = None
+        else:
+            record.update(mtime=mtime, size=size)
+        records.append((path, record))
+    return records
+
+
+class LocalLibrary:
+    """An index of the audio files in local directories, so they can be queued without any network requests
+
+    Scans only read the files that were added or changed since the last scan, judged by their mtime and
+    size, and read them in parallel worker processes. The index is saved as json next to the audio cache.
+
+    Attributes:
+        directories (list): The directories indexed, searched recursively
+        file (str): The json file the index is saved in
+        workers (int): The number of processes files are read with
+    """
+
+    batch_size = 32  # The number of files each worker process is given at once
+
+    def __init__(self, directories, file, workers=2):
+        """Loads the index from disk, scanning is started separately
+
+        Args:
+            directories (list): The directories to index
+            file (str): The json file the index is saved in
+            workers (int, optional): The number of processes files are read with
+        """
+        self.directories = list(directories)
+        self.file = file
+        self.workers = max(1, workers)
+        self._lock = threading.Lock()
+        self._scanning = threading.Lock()
+        self._files = {}  # dict with structure as : path: {'title', 'artist', 'track', 'duration', 'codec', ...}
+        if os.path.isfile(file):
+            try:
+                with open(file, 'r') as f:
+                    self._files = json.load(f)
+            except Exception:
+                bt.ERROR(f'Unable to read the library index {file}, indexing the library again')
+        self._ids = {self.song_id(path): path for path in self._files}  # dict with structure as : song id: path
+
+    def __len__(self):
+        return len(self._files)
+
+    @staticmethod
+    def song_id(path):
+        """Makes the id of a library song from its path
+
+        Args:
+            path (str): The path of the file
+
+        Returns:
+            str: The id of the song
+        """
+        return local_prefix + hashlib.sha1(path.encode()).hexdigest()[:16]
+
+    def scan(self):
+        """Brings the index up to date with the directories, this blocks and should be run off the event loop
+
+        Returns:
+            dict: The number of files added, updated and removed
+        """
+        with self._scanning:
+            start = time.monotonic()
+            found = {}  # dict with structure as : path: (mtime, size)
+            for directory in self.directories:
+                self._walk(directory, found)
+            with self._lock:
+                removed = [path for path in self._files if path not in found]
+                changed = [(path, mtime, size) for path, (mtime, size) in found.items()
+                           if path not in self._files or self._files[path]['mtime'] != mtime
+                           or self._files[path]['size'] != size]
+                added = sum(1 for path, mtime, size in changed if path not in self._files)
+            records = []
+            if changed:
+                batches = [changed[i:i + self.batch_size] for i in range(0, len(changed), self.batch_size)]
+                with ProcessPoolExecutor(max_workers=min(self.workers, len(batches))) as executor:
+                    for batch in executor.map(_read_batch, batches):
+                        records.extend(batch)
+            with self._lock:
+                for path in removed:
+                    del self._files[path]
+                    self._ids.pop(self.song_id(path), None)
+                for path, record in records:
+                    if record is None:
+                        bt.WARN(f'Unable to read the library file {path}')
+                        continue
+                    self._files[path] = record
+                    self._ids[self.song_id(path)] = path
+                if changed or removed:
+                    write_json(self.file, self._files)
+            bt.INFO(f'Scanned the library in {time.monotonic() - start:.1f}s: {len(self._files)} songs, '
+                    f'{added} added, {len(changed) - added} updated, {len(removed)} removed')
+            return {'added': added, 'updated': len(changed) - added, 'removed': len(removed)}
+
+    def _walk(self, directory, found):
+        """Lists the audio files under a directory
+
+        Args:
+            directory (str): The directory
+            found (dict): The mtime and size of each file found, added to
+        """
+        try:
+            entries = list(os.scandir(directory))
+        except OSError:
+            ex_type, ex_value, ex_traceback = sys.exc_info()
+            bt.WARN(f'Unable to read the library directory {directory}: {ex_value}')
+            return
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                self._walk(entry.path, found)
+            elif os.path.splitext(entry.name)[1].lower() in audio_extensions:
+                stat = entry.stat()
+                found[os.path.abspath(entry.path)] = (stat.st_mtime, stat.st_size)
+
+    def songs(self):
+        """Lists the names of every library song
+
+        Returns:
+            list: The id, title, artist and track of each song
+        """
+        with self._lock:
+            return [(self.song_id(path), record['title'], record['artist'], record['track'])
+                    for path, record in self._files.items()]
+
+    def get(self, path):
+        """Builds the track of a library song
+
+        Args:
+            path (str): The path or id of the song
+
+        Returns:
+            Track: The song, ready to play from disk
+            None: If the song is not in the library
+        """
+        with self._lock:
+            path = self._ids.get(path, path)
+            record = self._files.get(path)
+            if record is None:
+                return None
+            return Track(self.song_id(path), record['title'], path, artist=record['artist'], track=record['track'],
+                         duration=record['duration'], file=path, size=record['size'], ready=True)
+
+    def is_opus(self, path):
+        """Returns if a library file holds an Opus stream that can be sent without re-encoding
+
+        Args:
+            path (str): The path of the file
+
+        Returns:
+            bool: True if the file's codec is Opus
+        """
+        with self._lock:
+            record = self._files.get(path)
+        if record is None or record['codec'] is None:
+            return os.path.splitext(path)[1] == '.opus'
+        return record['codec'] == 'opus'
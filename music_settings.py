@@ -0,0 +1,134 @@
+import os
+
+import bot_util as bt
+from Secure import load_data
+
+
+class MusicSettings:
+    """The tunable settings of the Music extension
+
+    Every attribute can be overridden by a key of the same name in music.json
+
+    Attributes:
+        download_workers (int): The number of threads resolving and downloading songs at once
+        prefetch_depth (int): How many songs after the current one are downloaded ahead of time
+        prefetch_budget (int): The number of bytes of upcoming songs each guild may download ahead of time
+        opus_passthrough (bool): If songs are stored as their native Opus stream and sent to discord as is
+        progressive_playback (bool): If songs start playing from their stream while they are still downloading
+        progressive_prebuffer (int): The number of 20ms frames of a stream buffered before it starts playing
+        stall_timeout (int): The number of seconds to wait on a download before opening a new stream
+        gapless_playback (bool): If the next song is opened ahead of time and played straight after the current one
+        prewarm_seconds (int): The number of seconds before the end of a song that the next song is opened
+        playlist_limit (int): The number of songs of a playlist queued by a single !play -a
+        playlist_batch (int): The number of playlist songs that are looked up together as they near the front of a queue
+        queue_page_size (int): The number of upcoming songs shown on each page of the queue message
+        idle_timeout (int): The number of seconds the bot stays in a voice channel with nothing queued
+        render_interval (float): The least number of seconds between two edits of a guild's queue and preview messages
+        guild_lookups (int): The number of !play searches and lookups a guild may run at once
+        global_lookups (int): The number of !play searches and lookups run at once across every guild
+        max_pending_downloads (int): The number of downloads waiting for a worker before new songs are refused
+        guild_downloads (int): The number of downloads and playlist lookups a guild may have in flight before its
+            new songs are refused
+        max_queue_length (int): The number of songs a guild's queue may hold
+        max_track_duration (int): The length in seconds of the longest song that may be queued
+        command_rate (int): The number of !play commands a user may send within command_window
+        command_window (int): The number of seconds command_rate applies to
+        lookup_attempts (int): The number of times a YouTube search or extraction is tried before giving up
+        backoff_base (float): The largest number of seconds waited before the first retry, doubling on each retry
+        backoff_cap (float): The largest number of seconds waited before any retry
+        search_timeout (int): The number of seconds a YouTube search may take
+        extract_timeout (int): The number of seconds youtube_dl waits on YouTube before an extraction fails
+        breaker_threshold (int): The number of failures in a row after which YouTube calls fail fast
+        breaker_reset (int): The number of seconds YouTube calls fail fast before they are tried again
+        hedge_after (float): The number of seconds before a slow search or extraction is sent again, 0 to never
+        library_directories (list): The directories of local audio files that !play finds songs in before YouTube
+        library_workers (int): The number of processes that read the tags of new library files
+        title_match_threshold (float): The share of a search's trigrams a known song's name needs to answer it
+        audio_nodes (list): The socket paths of the audio nodes songs are played on, played by the bot if empty
+        node_timeout (int): The number of seconds to wait on an audio node before playing a song locally
+        history_half_life (int): The number of seconds after which a play counts half as much towards popularity
+        warm_top_songs (int): The number of most popular songs kept downloaded during off-peak hours, 0 to never
+        warm_hours (list): The hours of the day, in the bot's local time, that popular songs are downloaded in
+        warm_interval (int): The number of seconds between checks for an off-peak hour to download popular songs in
+        cache_directory (str): The directory downloaded songs are kept in
+        cache_budget (int): The number of bytes of songs kept on disk before the least popular are deleted
+        metadata_ttl (int): The number of seconds before the stored information of a song is refreshed
+        search_cache_size (int): The number of search queries whose results are remembered
+        search_cache_ttl (int): The number of seconds search results are remembered for
+        search_negative_ttl (int): The number of seconds a search that found nothing useful is remembered for
+    """
+
+    download_workers = 2
+    prefetch_depth = 3
+    prefetch_budget = 100_000_000
+    opus_passthrough = True
+    progressive_playback = True
+    progressive_prebuffer = 50
+    stall_timeout = 30
+    gapless_playback = True
+    prewarm_seconds = 10
+    playlist_limit = 500
+    playlist_batch = 10
+    queue_page_size = 15
+    idle_timeout = 50
+    render_interval = 2.0
+    guild_lookups = 2
+    global_lookups = 16
+    max_pending_downloads = 64
+    guild_downloads = 8
+    max_queue_length = 1000
+    max_track_duration = 10800
+    command_rate = 5
+    command_window = 10
+    lookup_attempts = 4
+    backoff_base = 0.5
+    backoff_cap = 8.0
+    search_timeout = 10
+    extract_timeout = 20
+    breaker_threshold = 5
+    breaker_reset = 30
+    hedge_after = 0
+    library_directories = []
+    library_workers = 2
+    title_match_threshold = 0.8
+    audio_nodes = []
+    node_timeout = 10
+    history_half_life = 604800
+    warm_top_songs = 50
+    warm_hours = [3, 4, 5, 6]
+    warm_interval = 1800
+    cache_directory = 'songs'
+    cache_budget = 2_000_000_000
+    metadata_ttl = 604800
+    search_cache_size = 512
+    search_cache_ttl = 86400
+    search_negative_ttl = 300
+
+    def __init__(self, data=None):
+        """Initialises the settings, overriding the defaults with data
+
+        Args:
+            data (dict, optional): The overrides read from the settings file
+        """
+        if data is None:
+            return
+
+        for key, value in data.items():
+            if hasattr(MusicSettings, key):
+                setattr(self, key, value)
+            else:
+                bt.WARN(f'Ignoring unknown music setting: {key}')
+
+
+def load_settings(file='music.json'):
+    """Loads the Music settings, falling back to the defaults if there is no settings file
+
+    Args:
+        file (str, optional): The json file holding the overrides
+
+    Returns:
+        MusicSettings: The settings of the Music extension
+    """
+    if not os.path.isfile(file):
+        return MusicSettings()
+    return MusicSettings(load_data(file))
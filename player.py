@@ -0,0 +1,360 @@
+import asyncio
+import sys
+import threading
+from collections import deque
+
+import discord
+
+import bot_util as bt
+from tracks import TrackQueue
+
+FRAME_SECONDS = 0.02  # The length of the audio in each frame read by the voice client
+
+
+def _retrieve(future):
+    """Marks the exception of an action as retrieved, as it has already been logged by the player
+
+    Args:
+        future (asyncio.Future): The future of the action
+    """
+    if not future.cancelled():
+        future.exception()
+
+
+class TrackSource(discord.AudioSource):
+    """Wraps the audio source of a song, keeping track of how far into the song playback is
+
+    Frames can be read ahead of time with prebuffer, so that playback can start without waiting on
+    the source.
+
+    Attributes:
+        source (discord.AudioSource): The wrapped source
+        start (float): The position in seconds the source starts from
+        streamed (bool): If the source is streamed from the network rather than read from the cache
+        duration (float): The length of the song in seconds, None if it is not known
+        frames (int): The number of frames that have been played
+    """
+
+    def __init__(self, source, start=0, streamed=False, duration=None):
+        """Wraps an audio source
+
+        Args:
+            source (discord.AudioSource): The source to wrap
+            start (float, optional): The position in seconds the source starts from
+            streamed (bool, optional): If the source is streamed from the network
+            duration (float, optional): The length of the song in seconds
+        """
+        self.source = source
+        self.start = start
+        self.streamed = streamed
+        self.duration = duration
+        self.frames = 0
+        self._buffer = deque()
+
+    @property
+    def position(self):
+        """Returns how far into the song playback is
+
+        Returns:
+            float: The position in seconds
+        """
+        return self.start + self.frames * FRAME_SECONDS
+
+    def remaining(self):
+        """Returns how much of the song is left to play
+
+        Returns:
+            float: The number of seconds left, None if the duration is not known
+        """
+        if self.duration is None:
+            return None
+        return self.duration - self.position
+
+    def ended_early(self, tolerance):
+        """Returns if a stream stopped well before the end of its song, which means the connection failed
+
+        Args:
+            tolerance (float): The number of seconds a stream may stop before the end of its song
+
+        Returns:
+            bool: True if the stream should be resumed
+        """
+        remaining = self.remaining()
+        return self.streamed and remaining is not None and remaining > tolerance
+
+    def prebuffer(self, frames):
+        """Reads frames ahead of playback, this blocks until they are read or the source ends
+
+        Args:
+            frames (int): The number of frames to read
+
+        Returns:
+            int: The number of frames buffered
+        """
+        while len(self._buffer) < frames:
+            data = self.source.read()
+            if not data:
+                break
+            self._buffer.append(data)
+        return len(self._buffer)
+
+    def read(self):
+        """Reads the next frame, from the buffer first
+
+        Returns:
+            bytes: The frame, empty once the song has ended
+        """
+        data = self._buffer.popleft() if self._buffer else self.source.read()
+        if data:
+            self.frames += 1
+        return data
+
+    def is_opus(self):
+        """Returns if the frames are Opus packets
+
+        Returns:
+            bool: If the wrapped source is Opus encoded
+        """
+        return self.source.is_opus()
+
+    def cleanup(self):
+        """Cleans up the wrapped source
+        """
+        self._buffer.clear()
+        self.source.cleanup()
+
+
+class GaplessSource(discord.AudioSource):
+    """Plays a player's songs back to back on a single voice client player
+
+    The next song is opened and buffered ahead of time with queue_next, and the moment the current
+    song runs out of frames the next one is read instead, so there is no silence while FFmpeg starts.
+    Every method other than read is called from the event loop, read is called from the voice thread.
+
+    Attributes:
+        track (TrackSource): The source of the song being played
+        lead (float): The number of seconds before the end of a song that on_near_end is called
+        tolerance (float): The number of seconds a stream may stop early and still count as finished
+        near_end (bool): If the current song is within lead seconds of its end
+    """
+
+    def __init__(self, track, on_switch, on_near_end, lead=5, tolerance=5):
+        """Wraps the source of the first song
+
+        Args:
+            track (TrackSource): The source of the first song
+            on_switch: Called from the voice thread with the song and source switched to
+            on_near_end: Called from the voice thread once each song is within lead seconds of its end
+            lead (float, optional): The number of seconds before the end of a song that on_near_end is called
+            tolerance (float, optional): The number of seconds a stream may stop early and still count as finished
+        """
+        self.track = track
+        self.lead = lead
+        self.tolerance = tolerance
+        self.near_end = False
+        self._on_switch = on_switch
+        self._on_near_end = on_near_end
+        self._upcoming = None  # tuple with structure as : (Track, TrackSource)
+        self._closed = False
+        self._lock = threading.Lock()
+
+    def queue_next(self, song, track):
+        """Sets the source that is switched to when the current song ends, replacing any earlier one
+
+        Args:
+            song (Track): The next song
+            track (TrackSource): The buffered source of the next song
+
+        Returns:
+            bool: False if playback has ended or the source cannot follow the current one, the caller keeps it
+        """
+        with self._lock:
+            if self._closed or track.is_opus() != self.track.is_opus():
+                return False
+            previous, self._upcoming = self._upcoming, (song, track)
+        if previous is not None:
+            previous[1].cleanup()
+        return True
+
+    def discard_next(self):
+        """Drops the pre-opened next song, as the queue no longer starts with it
+        """
+        with self._lock:
+            upcoming, self._upcoming = self._upcoming, None
+        if upcoming is not None:
+            upcoming[1].cleanup()
+
+    def read(self):
+        """Reads the next frame, moving on to the next song when the current one ends
+
+        Returns:
+            bytes: The frame, empty once there is nothing left to play
+        """
+        data = self.track.read()
+        if data:
+            remaining = self.track.remaining()
+            if not self.near_end and remaining is not None and remaining <= self.lead:
+                self.near_end = True
+                self._on_near_end()
+            return data
+        if self.track.ended_early(self.tolerance):
+            return data
+        with self._lock:
+            upcoming, self._upcoming = self._upcoming, None
+        if upcoming is None:
+            return data
+        finished = self.track
+        song, self.track = upcoming
+        self.near_end = False
+        finished.cleanup()
+        self._on_switch(song, self.track)
+        return self.track.read()
+
+    def is_opus(self):
+        """Returns if the frames are Opus packets
+
+        Returns:
+            bool: If the current song is Opus encoded
+        """
+        return self.track.is_opus()
+
+    def cleanup(self):
+        """Cleans up the current song and the pre-opened next song
+        """
+        with self._lock:
+            self._closed = True
+            upcoming, self._upcoming = self._upcoming, None
+        if upcoming is not None:
+            upcoming[1].cleanup()
+        self.track.cleanup()
+
+
+class GuildPlayer:
+    """The music player of a single guild
+
+    Every change to the player's state is run through its mailbox, one at a time in the order it
+    was sent, so plays, skips, stops and track advancement on the same guild never interleave.
+
+    Attributes:
+        guild (discord.Guild): The guild the player belongs to
+        voice_client (discord.VoiceClient): The voice connection of the player
+        queue (TrackQueue): The queued songs, the first song is the one playing
+        page (int): The page of the queue shown in the queue message, starting from 0
+        source (TrackSource): The source of the song being played
+        output (GaplessSource): The source given to the voice client, None if songs are not played back to back
+        station (BroadcastChannel): The radio station the player is tuned in to, None if it plays its own queue
+        token (int): Counts the songs started, so that stale end of song events can be ignored
+        waiting_since (float): The monotonic time the song at the front of the queue started waiting to be played,
+            None once it has started
+        closed (bool): If the player has been closed and no longer runs actions
+    """
+
+    def __init__(self, guild, voice_client):
+        """Initialises the player and starts processing its mailbox
+
+        Args:
+            guild (discord.Guild): The guild the player belongs to
+            voice_client (discord.VoiceClient): The voice connection of the player
+        """
+        self.guild = guild
+        self.voice_client = voice_client
+        self.queue = TrackQueue()
+        self.page = 0
+        self.source = None
+        self.output = None
+        self.station = None
+        self.token = 0
+        self.waiting_since = None
+        self.closed = False
+        self._mailbox = asyncio.Queue()
+        self._worker = asyncio.create_task(self._process())
+
+    @property
+    def guild_id(self):
+        """Returns the id of the player's guild
+
+        Returns:
+            int: The id of the guild
+        """
+        return self.guild.id
+
+    @property
+    def now_playing(self):
+        """Returns the song at the front of the queue
+
+        Returns:
+            Track: The song being played
+            None: If the queue is empty
+        """
+        if len(self.queue) == 0:
+            return None
+        return self.queue[0]
+
+    def post(self, action, *args):
+        """Sends an action to the mailbox without waiting for it to run
+
+        Args:
+            action: The coroutine function to run
+            *args: The arguments of the action
+
+        Returns:
+            asyncio.Future: A future holding the result of the action, None if the player is closed
+        """
+        future = asyncio.get_event_loop().create_future()
+        future.add_done_callback(_retrieve)
+        if self.closed:
+            future.set_result(None)
+        else:
+            self._mailbox.put_nowait((action, args, future))
+        return future
+
+    def post_threadsafe(self, loop, action, *args):
+        """Sends an action to the mailbox from a thread other than the event loop's
+
+        Args:
+            loop (asyncio.AbstractEventLoop): The loop the player runs on
+            action: The coroutine function to run
+            *args: The arguments of the action
+        """
+        loop.call_soon_threadsafe(self.post, action, *args)
+
+    async def submit(self, action, *args):
+        """Sends an action to the mailbox and waits for it to run
+
+        Args:
+            action: The coroutine function to run
+            *args: The arguments of the action
+
+        Returns:
+            The value returned by the action, None if the player is closed
+        """
+        return await self.post(action, *args)
+
+    def close(self):
+        """Stops processing the mailbox, actions that have not run yet are skipped
+        """
+        if not self.closed:
+            self.closed = True
+            self._mailbox.put_nowait((None, (), None))
+
+    async def _process(self):
+        """Runs the actions sent to the mailbox one after the other
+        """
+        while True:
+            action, args, future = await self._mailbox.get()
+            if action is None:
+                return
+            if self.closed:
+                if not future.done():
+                    future.set_result(None)
+                continue
+            try:
+                result = await action(*args)
+            except Exception as e:
+                ex_type, ex_value, ex_traceback = sys.exc_info()
+                bt.ERROR(f'Player action {action.__name__} failed in {self.guild.name}: {ex_value}')
+                if not future.done():
+                    future.set_exception(e)
+            else:
+                if not future.done():
+                    future.set_result(result)
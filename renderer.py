@@ -0,0 +1,153 @@
+import asyncio
+import sys
+import time
+
+import discord
+
+import bot_util as bt
+
+queue_header = '**__Queue list:__**'  # The start of the queue message, used to find it in the music channel
+
+
+class MessageRenderer:
+    """Keeps the preview and queue messages of each guild's music channel in step with its player
+
+    Changes only mark a guild as needing a render. Everything that changes within the same interval is
+    drawn by a single render, from the player's state at that moment, so each message is edited at most
+    once per interval. A message is not edited if it would look the same. The messages are looked up in
+    the channel once and their handles kept until they are deleted.
+
+    Attributes:
+        interval (float): The least number of seconds between two renders of a guild
+        edits (int): The number of messages edited
+        skipped (int): The number of edits skipped because the message had not changed
+    """
+
+    def __init__(self, get_channel, render_queue, render_preview, interval=2.0, search_limit=20):
+        """Initialises the renderer
+
+        Args:
+            get_channel: A function returning the music channel of a guild
+            render_queue: A function returning the contents of the queue message of a player
+            render_preview: A function returning the embed of the preview message of a player
+            interval (float, optional): The least number of seconds between two renders of a guild
+            search_limit (int, optional): The number of recent messages searched for the queue message
+        """
+        self.interval = interval
+        self.edits = 0
+        self.skipped = 0
+        self._get_channel = get_channel
+        self._render_queue = render_queue
+        self._render_preview = render_preview
+        self._search_limit = search_limit
+        self._handles = {}  # dict with structure as : guild id: (queue message, preview message)
+        self._rendered = {}  # dict with structure as : guild id: {'queue': contents, 'preview': embed dict}
+        self._players = {}  # dict with structure as : guild id: player to render
+        self._pending = {}  # dict with structure as : guild id: render task
+        self._last = {}  # dict with structure as : guild id: time of the last render
+
+    def update(self, player):
+        """Marks the messages of a player's guild as out of date, they are rendered within the interval
+
+        Args:
+            player (GuildPlayer): The player whose state changed
+        """
+        gid = player.guild_id
+        self._players[gid] = player
+        if gid in self._pending:
+            return
+        delay = max(0.0, self._last.get(gid, 0) + self.interval - time.monotonic())
+        self._pending[gid] = asyncio.create_task(self._render_later(gid, delay))
+
+    def forget(self, gid):
+        """Drops the message handles of a guild, for when its music channel is set up again
+
+        Args:
+            gid (int): The id of the guild
+        """
+        self._handles.pop(gid, None)
+        self._rendered.pop(gid, None)
+
+    def close(self):
+        """Cancels the renders that have not run yet
+        """
+        for task in self._pending.values():
+            task.cancel()
+        self._pending.clear()
+        self._players.clear()
+
+    async def _render_later(self, gid, delay):
+        """Waits out the interval, then renders the latest state of a guild's player
+
+        Args:
+            gid (int): The id of the guild
+            delay (float): The number of seconds to wait
+        """
+        await asyncio.sleep(delay)
+        del self._pending[gid]
+        player = self._players.pop(gid)
+        self._last[gid] = time.monotonic()
+        try:
+            await self._render(player)
+        except Exception:
+            ex_type, ex_value, ex_traceback = sys.exc_info()
+            bt.ERROR(f'Unable to update the music messages of {player.guild.name}: {ex_value}')
+
+    async def _render(self, player):
+        """Edits the messages of a player's guild that no longer match its state
+
+        Args:
+            player (GuildPlayer): The player to render
+        """
+        gid = player.guild_id
+        handles = await self._find_messages(player.guild)
+        if handles is None:
+            return
+        queue_message, preview_message = handles
+        rendered = self._rendered.setdefault(gid, {})
+        contents = self._render_queue(player)
+        embed = self._render_preview(player)
+        preview = embed.to_dict()
+        try:
+            if rendered.get('queue') != contents:
+                await queue_message.edit(content=contents)
+                rendered['queue'] = contents
+                self.edits += 1
+            else:
+                self.skipped += 1
+            if rendered.get('preview') != preview:
+                await preview_message.edit(embed=embed)
+                rendered['preview'] = preview
+                self.edits += 1
+            else:
+                self.skipped += 1
+        except discord.NotFound:
+            bt.WARN(f'The music messages of {player.guild.name} have been deleted, looking them up again')
+            self.forget(gid)
+
+    async def _find_messages(self, guild):
+        """Gets the queue and preview messages of a guild, searching the music channel the first time
+
+        Args:
+            guild (discord.Guild): The guild
+
+        Returns:
+            tuple: tuple containing:
+                    discord.Message: the queue message
+                    discord.Message: the preview message, sent just before the queue message
+            None: If the messages could not be found
+        """
+        handles = self._handles.get(guild.id)
+        if handles is not None:
+            return handles
+        channel = self._get_channel(guild)
+        if channel is None:
+            return None
+        messages = await channel.history(limit=self._search_limit).flatten()
+        for index, message in enumerate(messages[:-1]):
+            if message.author == guild.me and message.content.startswith(queue_header):
+                handles = (message, messages[index + 1])
+                self._handles[guild.id] = handles
+                return handles
+        bt.ERROR(f'Unable to find the queue message in {guild.name}, run !setup music')
+        return None
@@ -0,0 +1,218 @@
+import asyncio
+import random
+import time
+
+import bot_util as bt
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an upstream that has been failing
+    """
+
+
+def backoff(attempt, base=0.5, cap=8.0):
+    """Returns how long to wait before a retry, drawn at random up to an exponentially growing bound
+
+    Waiting a random part of the bound spreads out the retries of every guild that failed at the same time,
+    instead of having them all hit the upstream again together.
+
+    Args:
+        attempt (int): The number of attempts already made, starting from 1
+        base (float, optional): The bound in seconds after the first attempt
+        cap (float, optional): The largest bound in seconds
+
+    Returns:
+        float: The number of seconds to wait
+    """
+    return random.uniform(0, min(cap, base * 2 ** (attempt - 1)))
+
+
+class CircuitBreaker:
+    """Stops calling an upstream after repeated failures, letting a single trial call through once it has rested
+
+    A trial that never reports back, such as a cancelled call, is given up on after another reset_timeout.
+
+    Attributes:
+        name (str): The name of the upstream, used in the logs
+        threshold (int): The number of failures in a row that open the circuit
+        reset_timeout (float): The number of seconds the circuit stays open before a trial call
+        state (str): closed while calls go through, open while they fail fast and half-open during a trial
+    """
+
+    def __init__(self, name, threshold=5, reset_timeout=30):
+        """Initialises the breaker closed
+
+        Args:
+            name (str): The name of the upstream
+            threshold (int, optional): The number of failures in a row that open the circuit
+            reset_timeout (float, optional): The number of seconds the circuit stays open before a trial call
+        """
+        self.name = name
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.state = 'closed'
+        self._failures = 0
+        self._opened_at = 0
+
+    def check(self):
+        """Checks that a call may be made, moving an open circuit that has rested to half-open
+
+        Raises:
+            CircuitOpenError: If the circuit is open, or a trial call is already running
+        """
+        if self.state == 'closed':
+            return
+        if time.monotonic() - self._opened_at >= self.reset_timeout:
+            bt.INFO(f'Trying {self.name} again')
+            self.state = 'half-open'
+            self._opened_at = time.monotonic()
+            return
+        raise CircuitOpenError(f'{self.name} is unavailable')
+
+    def success(self):
+        """Records a call that succeeded, closing the circuit
+        """
+        if self.state != 'closed':
+            bt.INFO(f'{self.name} has recovered')
+        self.state = 'closed'
+        self._failures = 0
+
+    def failure(self):
+        """Records a call that failed, opening the circuit after too many in a row or a failed trial
+        """
+        self._failures += 1
+        if self.state == 'half-open' or (self.state == 'closed' and self._failures >= self.threshold):
+            bt.WARN(f'{self.name} failed {self._failures} times in a row, '
+                    f'failing fast for {self.reset_timeout} seconds')
+            self.state = 'open'
+            self._opened_at = time.monotonic()
+
+
+class Endpoint:
+    """Calls an upstream with a timeout, retries with backoff, a shared circuit breaker and optional hedging
+
+    A hedged call starts a second copy of a call that is slow to answer and takes whichever finishes
+    first, cutting the tail latency at the cost of some duplicate requests. Only errors the retryable
+    function accepts, such as timeouts, are retried and counted by the breaker, other errors mean the
+    upstream answered and are raised at once.
+
+    Attributes:
+        name (str): The name of the upstream, used in the logs
+        breaker (CircuitBreaker): The breaker shared by every call to the upstream
+        timeout (float): The number of seconds an attempt may take, None for no limit
+        attempts (int): The number of attempts made before giving up
+        hedge_after (float): The number of seconds before a second copy of a call is started, 0 to never hedge
+        hedged (int): The number of hedged copies started
+        retryable: A function given an error that returns False for permanent errors, None to retry every error
+    """
+
+    def __init__(self, name, timeout=None, attempts=4, base_delay=0.5, max_delay=8.0, threshold=5,
+                 reset_timeout=30, hedge_after=0, retryable=None):
+        """Initialises the endpoint
+
+        Args:
+            name (str): The name of the upstream
+            timeout (float, optional): The number of seconds an attempt may take
+            attempts (int, optional): The number of attempts made before giving up
+            base_delay (float, optional): The bound in seconds of the wait after the first attempt
+            max_delay (float, optional): The largest bound in seconds of a wait between attempts
+            threshold (int, optional): The number of failures in a row that open the circuit
+            reset_timeout (float, optional): The number of seconds the circuit stays open before a trial call
+            hedge_after (float, optional): The number of seconds before a second copy of a call is started
+            retryable (optional): A function given an error that returns False for permanent errors
+        """
+        self.name = name
+        self.breaker = CircuitBreaker(name, threshold=threshold, reset_timeout=reset_timeout)
+        self.timeout = timeout
+        self.attempts = max(1, attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.hedge_after = hedge_after
+        self.hedged = 0
+        self.retryable = retryable
+
+    async def call(self, fn, *args, accept=None):
+        """Calls the upstream until it gives an accepted result or every attempt is used up
+
+        Args:
+            fn: The coroutine function making the call
+            *args: The arguments of fn
+            accept (optional): A function returning False for results worth retrying, such as empty searches
+
+        Returns:
+            The result of the call, the last one if none was accepted
+
+        Raises:
+            CircuitOpenError: If the upstream has been failing
+            Exception: The error of the last attempt if every attempt failed, or the first permanent error
+        """
+        attempt = 0
+        while True:
+            self.breaker.check()
+            error = None
+            try:
+                result = await self._attempt(fn, args)
+            except Exception as e:
+                if self.retryable is not None and not self.retryable(e):
+                    self.breaker.success()
+                    raise
+                self.breaker.failure()
+                error, result = e, None
+            else:
+                self.breaker.success()
+                if accept is None or accept(result):
+                    return result
+            attempt += 1
+            if attempt >= self.attempts:
+                if error is not None:
+                    raise error
+                return result
+            delay = backoff(attempt, self.base_delay, self.max_delay)
+            reason = f'failed: {str(error) or type(error).__name__}' if error is not None else 'gave nothing useful'
+            bt.WARN(f'{self.name} {reason}, retrying in {delay:.1f} seconds')
+            await asyncio.sleep(delay)
+
+    async def _attempt(self, fn, args):
+        """Makes one attempt, hedging it if it is slow to answer
+
+        Args:
+            fn: The coroutine function making the call
+            args (tuple): The arguments of fn
+
+        Returns:
+            The result of the first copy to succeed
+        """
+        if not self.hedge_after:
+            return await self._timed(fn, args)
+        first = asyncio.ensure_future(self._timed(fn, args))
+        pending = {first}
+        try:
+            done, pending = await asyncio.wait(pending, timeout=self.hedge_after)
+            if done:
+                return first.result()
+            self.hedged += 1
+            pending.add(asyncio.ensure_future(self._timed(fn, args)))
+            while True:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                succeeded = [task for task in done if task.exception() is None]
+                if succeeded:
+                    return succeeded[0].result()
+                if not pending:
+                    return done.pop().result()
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def _timed(self, fn, args):
+        """Makes a single call within the endpoint's timeout
+
+        Args:
+            fn: The coroutine function making the call
+            args (tuple): The arguments of fn
+
+        Returns:
+            The result of the call
+        """
+        if self.timeout is None:
+            return await fn(*args)
+        return await asyncio.wait_for(fn(*args), self.timeout)
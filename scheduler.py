@@ -0,0 +1,126 @@
+import asyncio
+import heapq
+import itertools
+import sys
+
+import bot_util as bt
+
+
+class DeadlineScheduler:
+    """Runs callbacks at deadlines, using one timer on the event loop for every deadline
+
+    Deadlines are kept in a heap, and the loop is only asked to wake up for the earliest one. Each
+    deadline has a key, such as (guild id, 'idle'), and scheduling a key again replaces its deadline.
+    Cancelling only marks the deadline, which is dropped when it reaches the top of the heap, so both
+    take O(1) time besides the heap push.
+
+    Attributes:
+        fired (int): The number of callbacks that have run
+    """
+
+    def __init__(self):
+        """Initialises the scheduler, no timer is set until the first deadline is added
+        """
+        self.fired = 0
+        self._heap = []  # list of entries with structure as : [deadline, sequence, key, callback, args, active]
+        self._entries = {}  # dict with structure as : key: entry
+        self._counter = itertools.count()
+        self._timer = None
+        self._timer_deadline = None
+        self._cancelled = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def schedule(self, key, delay, callback, *args):
+        """Runs a callback on the event loop after a delay, replacing the deadline already set for key
+
+        Args:
+            key: The key of the deadline
+            delay (float): The number of seconds to wait
+            callback: The function to call, it must not block
+            *args: The arguments of callback
+        """
+        self.cancel(key)
+        loop = asyncio.get_event_loop()
+        entry = [loop.time() + delay, next(self._counter), key, callback, args, True]
+        self._entries[key] = entry
+        heapq.heappush(self._heap, entry)
+        self._arm(loop)
+
+    def cancel(self, key):
+        """Cancels the deadline set for key
+
+        Args:
+            key: The key of the deadline
+
+        Returns:
+            bool: True if there was a deadline to cancel
+        """
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return False
+        entry[5] = False
+        self._cancelled += 1
+        if self._cancelled > len(self._heap) // 2:
+            self._compact()
+        return True
+
+    def close(self):
+        """Cancels every deadline and the timer
+        """
+        self._entries.clear()
+        self._heap.clear()
+        self._cancelled = 0
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def _compact(self):
+        """Drops the cancelled deadlines from the heap once they make up most of it
+        """
+        self._heap = [entry for entry in self._heap if entry[5]]
+        heapq.heapify(self._heap)
+        self._cancelled = 0
+
+    def _arm(self, loop):
+        """Sets the timer for the earliest deadline if it is not already set for it
+
+        Args:
+            loop (asyncio.AbstractEventLoop): The loop the timer runs on
+        """
+        while self._heap and not self._heap[0][5]:
+            heapq.heappop(self._heap)
+            self._cancelled -= 1
+        if not self._heap:
+            return
+        deadline = self._heap[0][0]
+        if self._timer is not None:
+            if self._timer_deadline <= deadline:
+                return
+            self._timer.cancel()
+        self._timer = loop.call_at(deadline, self._fire)
+        self._timer_deadline = deadline
+
+    def _fire(self):
+        """Runs the callbacks whose deadlines have passed and sets the timer for the next one
+        """
+        self._timer = None
+        loop = asyncio.get_event_loop()
+        now = loop.time()
+        while self._heap and self._heap[0][0] <= now:
+            deadline, _, key, callback, args, active = heapq.heappop(self._heap)
+            if not active:
+                self._cancelled -= 1
+                continue
+            del self._entries[key]
+            self.fired += 1
+            try:
+                callback(*args)
+            except Exception:
+                ex_type, ex_value, ex_traceback = sys.exc_info()
+                bt.ERROR(f'Deadline {key} failed: {ex_value}')
+        self._arm(loop)
@@ -0,0 +1,422 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+import bot_util as bt
+
+stored_extensions = ('.webm', '.opus', '.ogg', '.m4a', '.mp3')  # The extensions songs are downloaded with
+
+
+def write_json(file, data):
+    """Writes data to a json file so that readers only ever see the old or the new contents
+
+    Each call writes to its own temporary file, so that threads and processes saving the same file at once
+    never write over each other's half written contents.
+
+    Args:
+        file (str): The path of the json file
+        data: The data to be saved
+    """
+    descriptor, temp = tempfile.mkstemp(suffix='.tmp', dir=os.path.dirname(file) or '.')
+    try:
+        with os.fdopen(descriptor, 'w') as f:
+            json.dump(data, f)
+        os.replace(temp, file)
+    except BaseException:
+        try:
+            os.remove(temp)
+        except OSError:
+            pass
+        raise
+
+
+def find_stored(directory, video_id):
+    """Finds the file of a song in a cache directory, whether or not the cache's index knows about it
+
+    Args:
+        directory (str): The cache directory
+        video_id (str): The YouTube id of the song
+
+    Returns:
+        str: The name of the song's file
+        None: If the song has no file
+    """
+    for extension in stored_extensions:
+        if os.path.isfile(os.path.join(directory, video_id + extension)):
+            return video_id + extension
+    return None
+
+
+class AudioCache:
+    """A size bounded store of downloaded songs, keyed by their YouTube video id
+
+    Songs are saved as <video id><extension> in the cache directory, next to an index holding the
+    size, last access time and hit count of every song. When the cache holds more than
+    max_bytes the least popular songs are deleted, and of equally popular songs the least recently
+    used. Songs put in the directory by other processes, such as warm_cache.py, are adopted into
+    the index the first time they are missed.
+
+    Attributes:
+        directory (str): The directory the songs are stored in
+        max_bytes (int): The number of bytes the cache may hold before songs are evicted
+        hits (int): The number of lookups that found their song
+        misses (int): The number of lookups that did not find their song
+    """
+
+    save_interval = 30  # The number of seconds lookups may go without saving the index
+
+    def __init__(self, directory='songs', max_bytes=2_000_000_000):
+        """Loads the index of the cache, dropping entries whose files have gone
+
+        Args:
+            directory (str, optional): The directory the songs are stored in
+            max_bytes (int, optional): The number of bytes the cache may hold before songs are evicted
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._index_file = os.path.join(directory, 'index.json')
+        self._partial = os.path.join(directory, '.partial')
+        self._lock = threading.RLock()
+        self._last_save = time.time()
+        self._dirty = False
+
+        shutil.rmtree(self._partial, ignore_errors=True)
+        os.makedirs(self._partial, exist_ok=True)
+
+        self._entries = {}
+        if os.path.isfile(self._index_file):
+            try:
+                with open(self._index_file, 'r') as f:
+                    self._entries = json.load(f)
+            except Exception:
+                bt.ERROR(f'Unable to read the song index {self._index_file}, starting with an empty cache')
+        for video_id in list(self._entries.keys()):
+            if not os.path.isfile(self.path(video_id)):
+                del self._entries[video_id]
+        bt.INFO(f'Loaded audio cache with {len(self._entries)} songs ({self.size} bytes)')
+
+    @property
+    def size(self):
+        """Returns the number of bytes held by the cache
+
+        Returns:
+            int: The total size of the cached songs
+        """
+        with self._lock:
+            return sum(entry['size'] for entry in self._entries.values())
+
+    @property
+    def stats(self):
+        """Returns the counters of the cache
+
+        Returns:
+            dict: The hits, misses, number of songs and bytes held by the cache
+        """
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'songs': len(self._entries), 'bytes': self.size}
+
+    def path(self, video_id):
+        """Gets the path a cached song is stored at
+
+        Args:
+            video_id (str): The YouTube id of the song
+
+        Returns:
+            str: The path of the song's file
+            None: If the song is not cached
+        """
+        with self._lock:
+            entry = self._entries.get(video_id) or self._adopt(video_id)
+            if entry is None:
+                return None
+            return os.path.join(self.directory, entry['file'])
+
+    def partial_path(self, video_id):
+        """Gets the path, without an extension, a song should be downloaded to before it is stored
+
+        Args:
+            video_id (str): The YouTube id of the song
+
+        Returns:
+            str: The path in the partial downloads directory
+        """
+        return os.path.join(self._partial, video_id)
+
+    def discard_partial(self, video_id):
+        """Deletes whatever a failed download of a song left in the partial downloads directory
+
+        Args:
+            video_id (str): The YouTube id of the song
+        """
+        prefix = video_id + '.'
+        for file in os.listdir(self._partial):
+            if file == video_id or file.startswith(prefix):
+                try:
+                    os.remove(os.path.join(self._partial, file))
+                except OSError:
+                    bt.WARN(f'Unable to delete the partial download {file}')
+
+    def lookup(self, video_id):
+        """Looks up a song in the cache without touching the network, counting the hit or miss
+
+        Args:
+            video_id (str): The YouTube id of the song
+
+        Returns:
+            dict: The index entry of the song
+            None: If the song is not cached
+        """
+        with self._lock:
+            entry = self._entries.get(video_id)
+            if entry is not None and not os.path.isfile(self.path(video_id)):
+                bt.WARN(f'Cached song {video_id} has been deleted from disk')
+                del self._entries[video_id]
+                entry = None
+            if entry is None:
+                entry = self._adopt(video_id)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            entry['hits'] += 1
+            entry['last_access'] = time.time()
+            self._dirty = True
+            if time.time() - self._last_save > self.save_interval:
+                self.save()
+            return dict(entry)
+
+    def _adopt(self, video_id):
+        """Adds a song another process stored in the directory to the index
+
+        Args:
+            video_id (str): The YouTube id of the song
+
+        Returns:
+            dict: The new index entry of the song
+            None: If the song has no file
+        """
+        file = find_stored(self.directory, video_id)
+        if file is None:
+            return None
+        entry = {'file': file, 'size': os.path.getsize(os.path.join(self.directory, file)),
+                 'last_access': time.time(), 'hits': 0}
+        self._entries[video_id] = entry
+        self._dirty = True
+        bt.INFO(f'Adopted {file} into the audio cache')
+        return entry
+
+    def store(self, video_id, source):
+        """Moves a finished download into the cache
+
+        Args:
+            video_id (str): The YouTube id of the song
+            source (str): The path of the finished download
+
+        Returns:
+            str: The path the song is stored at
+        """
+        extension = os.path.splitext(source)[1]
+        file = video_id + extension
+        destination = os.path.join(self.directory, file)
+        os.replace(source, destination)
+        with self._lock:
+            self._entries[video_id] = {'file': file, 'size': os.path.getsize(destination),
+                                       'last_access': time.time(), 'hits': 0}
+            self.save()
+        bt.INFO(f'Stored {video_id} in the audio cache')
+        return destination
+
+    def evict(self, keep=(), popularity=None):
+        """Deletes the least popular songs, then the least recently used, until the cache fits in max_bytes
+
+        Args:
+            keep (iterable, optional): The ids of songs that must not be deleted, such as queued songs
+            popularity (optional): A function given a video id that returns how popular the song is,
+                songs are only ordered by their last access if it is not given
+
+        Returns:
+            int: The number of songs deleted
+        """
+        keep = set(keep)
+        removed = 0
+        with self._lock:
+            size = self.size
+            if size <= self.max_bytes:
+                return 0
+            candidates = sorted((popularity(video_id) if popularity is not None else 0, entry['last_access'], video_id)
+                                for video_id, entry in self._entries.items() if video_id not in keep)
+            for score, last_access, video_id in candidates:
+                if size <= self.max_bytes:
+                    break
+                try:
+                    os.remove(self.path(video_id))
+                except OSError:
+                    bt.WARN(f'Unable to delete cached song {video_id}')
+                    continue
+                size -= self._entries.pop(video_id)['size']
+                removed += 1
+            self.save()
+        bt.INFO(f'Evicted {removed} songs from the audio cache')
+        return removed
+
+    def save(self):
+        """Writes the index to disk
+        """
+        with self._lock:
+            write_json(self._index_file, self._entries)
+            self._dirty = False
+            self._last_save = time.time()
+
+    def close(self):
+        """Saves the index if any lookups changed it since the last save
+        """
+        with self._lock:
+            if self._dirty:
+                self.save()
+
+
+class MetadataCache:
+    """A persistent store of the information youtube_dl returns for songs
+
+    Songs are keyed by their video id, and every url a song was requested with is kept as an alias so
+    that urls that are not plain video links can also be looked up without a request. Other processes
+    may write to the same file, so songs they stored are merged in before saving and on a miss. New songs
+    are saved at most every save_interval seconds, and on close.
+
+    Attributes:
+        file (str): The json file the store is saved in
+        ttl (int): The number of seconds after which a song's information should be refreshed
+    """
+
+    format_keys = ('format_id', 'ext', 'acodec', 'abr', 'asr', 'filesize')
+    save_interval = 30  # The number of seconds new songs may go without saving the store
+
+    def __init__(self, file, ttl=604800, on_merge=None):
+        """Loads the store from disk
+
+        Args:
+            file (str): The json file the store is saved in
+            ttl (int, optional): The number of seconds after which a song's information should be refreshed
+            on_merge (optional): A function given the metadata of each song merged in from another process after
+                the store was loaded
+        """
+        self.file = file
+        self.ttl = ttl
+        self._lock = threading.RLock()
+        self._songs = {}  # dict with structure as : video id: {'meta': {}, 'format': {}, 'fetched': time}
+        self._aliases = {}  # dict with structure as : url: video id
+        self._mtime = None
+        self._last_save = time.time()
+        self._dirty = False
+        self._on_merge = None
+        self._merge()
+        self._on_merge = on_merge
+        bt.INFO(f'Loaded metadata for {len(self._songs)} songs')
+
+    def _merge(self):
+        """Reads the songs saved to the file since it was last read or written, keeping the newest of each song
+        """
+        try:
+            mtime = os.path.getmtime(self.file)
+        except OSError:
+            return
+        if mtime == self._mtime:
+            return
+        try:
+            with open(self.file, 'r') as f:
+                data = json.load(f)
+        except Exception:
+            bt.ERROR(f'Unable to read the song metadata {self.file}, keeping the songs already loaded')
+            return
+        self._mtime = mtime
+        merged = []
+        for video_id, entry in data['songs'].items():
+            if video_id not in self._songs or self._songs[video_id]['fetched'] < entry['fetched']:
+                self._songs[video_id] = entry
+                merged.append(entry['meta'])
+        for url, video_id in data['aliases'].items():
+            self._aliases.setdefault(url, video_id)
+        if self._on_merge is not None:
+            for meta in merged:
+                self._on_merge(meta)
+
+    def get(self, url):
+        """Looks up the information of a song by its url
+
+        Args:
+            url (str): The url the song was requested with
+
+        Returns:
+            tuple: tuple containing:
+                    dict: the stored entry of the song
+                    bool: if the entry is older than the ttl and should be refreshed
+            None: If the song is not in the store
+        """
+        with self._lock:
+            video_id = bt.get_video_id(url) or self._aliases.get(url)
+            if video_id not in self._songs:
+                self._merge()
+                video_id = video_id or self._aliases.get(url)
+            entry = self._songs.get(video_id)
+            if entry is None:
+                return None
+            return dict(entry), time.time() - entry['fetched'] > self.ttl
+
+    def put(self, url, info, keys):
+        """Stores the information youtube_dl returned for a song
+
+        Args:
+            url (str): The url the song was requested with
+            info (dict): The information returned by youtube_dl
+            keys (tuple): The keys of info to keep as the song's metadata
+
+        Returns:
+            dict: The stored entry of the song
+        """
+        entry = {'meta': {key: info.get(key) for key in keys},
+                 'format': {key: info.get(key) for key in self.format_keys},
+                 'fetched': time.time()}
+        with self._lock:
+            self._songs[info['id']] = entry
+            self._aliases[url] = info['id']
+            self._dirty = True
+            if time.time() - self._last_save > self.save_interval:
+                self.save()
+        return dict(entry)
+
+    def reload(self):
+        """Reads the songs other processes saved since the file was last read or written
+        """
+        with self._lock:
+            self._merge()
+
+    def songs(self):
+        """Lists the metadata of every stored song
+
+        Returns:
+            list: The metadata of each song
+        """
+        with self._lock:
+            return [entry['meta'] for entry in self._songs.values()]
+
+    def save(self):
+        """Writes the store to disk
+        """
+        with self._lock:
+            self._merge()
+            write_json(self.file, {'songs': self._songs, 'aliases': self._aliases})
+            self._mtime = os.path.getmtime(self.file)
+            self._dirty = False
+            self._last_save = time.time()
+
+    def close(self):
+        """Saves the store if songs were added since the last save
+        """
+        with self._lock:
+            if self._dirty:
+                self.save()
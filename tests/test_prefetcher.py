@@ -0,0 +1,51 @@
+import asyncio
+import threading
+import unittest
+
+from downloader import DownloadPool, Prefetcher
+from tracks import Track
+
+
+class PrefetcherTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.pool = DownloadPool(max_workers=1)
+        self.downloads = []
+        self.release = threading.Event()
+
+        def download(song):
+            self.downloads.append(song.id)
+            self.release.wait(5)
+            return f'/songs/{song.id}.webm', 1000
+
+        self.prefetcher = Prefetcher(self.pool, download, depth=3)
+
+    async def asyncTearDown(self):
+        self.release.set()
+        self.pool.shutdown()
+
+    async def test_same_song_queued_twice_in_a_guild(self):
+        first = Track('aaaaaaaaaaa', 'A', 'https://www.youtube.com/watch?v=aaaaaaaaaaa')
+        second = Track('aaaaaaaaaaa', 'A', 'https://www.youtube.com/watch?v=aaaaaaaaaaa')
+        other = Track('ccccccccccc', 'C', 'https://www.youtube.com/watch?v=ccccccccccc')
+        self.prefetcher.update(1, [first, second, other])
+        await asyncio.sleep(0.05)
+        self.release.set()
+        self.assertTrue(await self.prefetcher.wait(1, second))
+        self.assertTrue(await self.prefetcher.wait(1, first))
+        self.assertEqual((second.file, second.size), ('/songs/aaaaaaaaaaa.webm', 1000))
+        self.assertEqual(self.downloads.count('aaaaaaaaaaa'), 1)
+
+    async def test_second_copy_plays_after_the_first_is_skipped(self):
+        first = Track('aaaaaaaaaaa', 'A', 'https://www.youtube.com/watch?v=aaaaaaaaaaa')
+        second = Track('aaaaaaaaaaa', 'A', 'https://www.youtube.com/watch?v=aaaaaaaaaaa')
+        self.prefetcher.update(1, [first])
+        await asyncio.sleep(0.05)
+        self.prefetcher.update(1, [second])
+        self.release.set()
+        self.assertTrue(await self.prefetcher.wait(1, second))
+        self.assertEqual(self.downloads.count('aaaaaaaaaaa'), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
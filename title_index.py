@@ -0,0 +1,161 @@
+import heapq
+import re
+from collections import Counter
+
+_words = re.compile(r'[^\W_]+')
+_decorations = re.compile(r'[(\[][^)\]]*[)\]]|\s(?:ft|feat|featuring)\.?\s.*$', re.IGNORECASE)
+_separator = re.compile(r'\s[-\u2013\u2014|]\s')
+
+
+def trigrams(text):
+    """Splits text into the three letter sequences of its words, padded so word boundaries count too
+
+    Args:
+        text (str): The text
+
+    Returns:
+        set: The trigrams of the text
+    """
+    grams = set()
+    for word in _words.findall(text.lower()):
+        padded = f'  {word} '
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def song_names(title, track=None):
+    """Finds the names of a song that a query has to mostly match to pick it, its track and the song part of its title
+
+    A title such as 'Artist - Song (Official Video)' is cut down to 'Song', so that a query naming only the
+    artist, or a word of the decorations, does not match most of any of the names.
+
+    Args:
+        title (str): The title of the song
+        track (str, optional): The name of the track
+
+    Returns:
+        list: The trigrams of each name
+    """
+    names = [_separator.split(_decorations.sub(' ', title))[-1]] if title else []
+    if track:
+        names.append(track)
+    return [grams for grams in map(trigrams, names) if grams]
+
+
+class FuzzyIndex:
+    """A trigram index over the names of known songs, so a repeated search can be answered from memory
+
+    Each song is indexed by the trigrams of its title, artist and track. A query scores a song by the share
+    of the query's trigrams found in the song's names, so extra words in a title such as '(Official Audio)'
+    do not count against it, and small typos only lose a few trigrams. To answer a query the song's track,
+    or the song part of its title, must also be mostly covered by the query, so that a query such as
+    'rick' does not pick whichever known song has the word in its title.
+
+    Attributes:
+        threshold (float): The least score a song needs to answer a query
+    """
+
+    min_trigrams = 4  # Queries shorter than this match too much to be answered from the index
+    min_coverage = 0.5  # The least share of the trigrams of one of a song's names that a query must match
+
+    def __init__(self, threshold=0.8):
+        """Initialises an empty index
+
+        Args:
+            threshold (float, optional): The least score a song needs to answer a query
+        """
+        self.threshold = threshold
+        self._songs = {}  # dict with structure as : song id: set of trigrams
+        self._names = {}  # dict with structure as : song id: [trigrams of each name a query must mostly match]
+        self._postings = {}  # dict with structure as : trigram: set of song ids
+
+    def __len__(self):
+        return len(self._songs)
+
+    def __contains__(self, key):
+        return key in self._songs
+
+    def add(self, key, title, artist=None, track=None):
+        """Indexes a song, replacing what was indexed for it before
+
+        Args:
+            key (str): The id of the song
+            title (str): The title of the song
+            artist (str, optional): The artist of the song
+            track (str, optional): The name of the track
+        """
+        self.remove(key)
+        grams = trigrams(' '.join(name for name in (title, artist, track) if name))
+        self._songs[key] = grams
+        self._names[key] = song_names(title, track)
+        for gram in grams:
+            self._postings.setdefault(gram, set()).add(key)
+
+    def remove(self, key):
+        """Drops a song from the index
+
+        Args:
+            key (str): The id of the song
+        """
+        grams = self._songs.pop(key, None)
+        if grams is None:
+            return
+        del self._names[key]
+        for gram in grams:
+            keys = self._postings[gram]
+            keys.discard(key)
+            if not keys:
+                del self._postings[gram]
+
+    def search(self, query, limit=5):
+        """Scores the songs sharing trigrams with a query
+
+        Args:
+            query (str): The search terms
+            limit (int, optional): The number of songs returned
+
+        Returns:
+            list: The (score, song id) of the best matches, best first
+        """
+        grams = trigrams(query)
+        if len(grams) < self.min_trigrams:
+            return []
+        shared = Counter()
+        for gram in grams:
+            shared.update(self._postings.get(gram, ()))
+        # Ties on the share of the query found go to the song with the fewest other trigrams
+        ranked = heapq.nsmallest(limit, shared.items(), key=lambda item: (-item[1], len(self._songs[item[0]])))
+        return [(count / len(grams), key) for key, count in ranked]
+
+    def coverage(self, query, key):
+        """Scores how much of a song's own name a query matches
+
+        Args:
+            query (str): The search terms
+            key (str): The id of the song
+
+        Returns:
+            float: The largest share of the trigrams of one of the song's names found in the query
+        """
+        grams = trigrams(query)
+        return max((len(grams & name) / len(name) for name in self._names.get(key, ())), default=0)
+
+    def best(self, query):
+        """Finds the song a query most likely asks for
+
+        Args:
+            query (str): The search terms
+
+        Returns:
+            str: The id of the song
+            None: If no song scores above the threshold, another song scores as well, or the query only
+                matches a small part of the song's names
+        """
+        matches = self.search(query, limit=2)
+        if not matches or matches[0][0] < self.threshold:
+            return None
+        if len(matches) > 1 and matches[1][0] == matches[0][0]:
+            return None
+        if self.coverage(query, matches[0][1]) < self.min_coverage:
+            return None
+        return matches[0][1]
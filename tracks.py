@@ -0,0 +1,354 @@
+import random
+from itertools import islice
+
+
+class Track:
+    """The information kept about a queued song
+
+    Attributes:
+        id (str): The YouTube id of the song
+        title (str): The title of the video
+        artist (str): The artist of the song, None if YouTube does not know it
+        track (str): The name of the song, None if YouTube does not know it
+        duration (int): The length of the song in seconds, None if it is not known
+        link (str): The url the song was requested with
+        file (str): The path of the downloaded song, None until it is downloaded
+        size (int): The size of the downloaded song in bytes, an estimate until it is downloaded
+        ready (bool): If the song has been downloaded
+        resolved (bool): If the song has been looked up, playlist songs are only looked up near the front of a queue
+        recoveries (int): The number of times the song's stream was resumed after failing
+        failed (bool): If the song could not be looked up or downloaded, it is not tried again
+    """
+
+    __slots__ = ('id', 'title', 'artist', 'track', 'duration', 'link', 'file', 'size', 'ready', 'resolved',
+                 'recoveries', 'failed')
+
+    def __init__(self, id, title, link, artist=None, track=None, duration=None, file=None, size=0, ready=False,
+                 resolved=True):
+        """Initialises the song's information
+
+        Args:
+            id (str): The YouTube id of the song
+            title (str): The title of the video
+            link (str): The url the song was requested with
+            artist (str, optional): The artist of the song
+            track (str, optional): The name of the song
+            duration (int, optional): The length of the song in seconds
+            file (str, optional): The path of the downloaded song
+            size (int, optional): The size of the song in bytes
+            ready (bool, optional): If the song has been downloaded
+            resolved (bool, optional): If the song has been looked up
+        """
+        self.id = id
+        self.title = title
+        self.link = link
+        self.artist = artist
+        self.track = track
+        self.duration = duration
+        self.file = file
+        self.size = size
+        self.ready = ready
+        self.resolved = resolved
+        self.recoveries = 0
+        self.failed = False
+
+    def __repr__(self):
+        return f'Track({self.id!r}, {self.title!r})'
+
+
+class _Node:
+    """A node of the queue's tree, holding one song
+    """
+
+    __slots__ = ('track', 'priority', 'size', 'left', 'right')
+
+    def __init__(self, track):
+        self.track = track
+        self.priority = random.random()
+        self.size = 1
+        self.left = None
+        self.right = None
+
+
+def _size(node):
+    return 0 if node is None else node.size
+
+
+def _update(node):
+    node.size = 1 + _size(node.left) + _size(node.right)
+
+
+def _split(node, count):
+    """Splits a tree into its first count songs and the rest
+
+    Args:
+        node (_Node): The root of the tree
+        count (int): The number of songs in the first tree
+
+    Returns:
+        tuple: tuple containing:
+                _Node: the root of the first count songs
+                _Node: the root of the rest
+    """
+    if node is None:
+        return None, None
+    if _size(node.left) < count:
+        left, right = _split(node.right, count - _size(node.left) - 1)
+        node.right = left
+        _update(node)
+        return node, right
+    left, right = _split(node.left, count)
+    node.left = right
+    _update(node)
+    return left, node
+
+
+def _merge(left, right):
+    """Joins two trees, every song of left coming before every song of right
+
+    Args:
+        left (_Node): The root of the first tree
+        right (_Node): The root of the second tree
+
+    Returns:
+        _Node: The root of the joined tree
+    """
+    if left is None:
+        return right
+    if right is None:
+        return left
+    if left.priority > right.priority:
+        left.right = _merge(left.right, right)
+        _update(left)
+        return left
+    right.left = _merge(left, right.left)
+    _update(right)
+    return right
+
+
+def _build(tracks):
+    """Builds a tree from songs in a single pass
+
+    Args:
+        tracks (iterable): The songs in order
+
+    Returns:
+        _Node: The root of the tree
+    """
+    spine = []
+    for track in tracks:
+        node = _Node(track)
+        last = None
+        while spine and spine[-1].priority < node.priority:
+            last = spine.pop()
+        node.left = last
+        if spine:
+            spine[-1].right = node
+        spine.append(node)
+    if not spine:
+        return None
+    root = spine[0]
+
+    order = []
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        order.append(node)
+        stack.extend(child for child in (node.left, node.right) if child is not None)
+    for node in reversed(order):
+        _update(node)
+    return root
+
+
+class TrackQueue:
+    """A guild's queue of songs, the first song is the one playing
+
+    The songs are kept in a randomly balanced tree ordered by position, so adding, removing and moving
+    songs anywhere in the queue takes O(log n) time however long the queue gets, and a page of the queue
+    is read without walking the songs before it. Indexing and slicing work like a list.
+    """
+
+    def __init__(self, tracks=()):
+        """Initialises the queue
+
+        Args:
+            tracks (iterable, optional): The songs to start the queue with
+        """
+        self._root = _build(tracks)
+
+    def __len__(self):
+        return _size(self._root)
+
+    def __bool__(self):
+        return self._root is not None
+
+    def __iter__(self):
+        return self._iter_from(0)
+
+    def __getitem__(self, index):
+        """Gets the song at a position, or a list of the songs in a slice
+
+        Args:
+            index (int or slice): The position of the song, slices may not have a step
+
+        Returns:
+            Track: The song at index
+            list: The songs in the slice
+        """
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                raise ValueError('Queue slices may not have a step')
+            return list(islice(self._iter_from(start), max(0, stop - start)))
+        node = self._root
+        index = self._position(index)
+        while True:
+            left = _size(node.left)
+            if index < left:
+                node = node.left
+            elif index == left:
+                return node.track
+            else:
+                index -= left + 1
+                node = node.right
+
+    def _position(self, index):
+        """Turns an index, which may count from the end, into a position in the queue
+
+        Args:
+            index (int): The index
+
+        Returns:
+            int: The position in the queue
+        """
+        length = len(self)
+        if index < 0:
+            index += length
+        if not 0 <= index < length:
+            raise IndexError('Queue index out of range')
+        return index
+
+    def _iter_from(self, start):
+        """Walks the queue in order from a position
+
+        Args:
+            start (int): The position of the first song
+
+        Yields:
+            Track: The songs from start to the end of the queue
+        """
+        stack = []
+        node = self._root
+        while node is not None:
+            left = _size(node.left)
+            if start < left:
+                stack.append(node)
+                node = node.left
+            elif start == left:
+                stack.append(node)
+                node = None
+            else:
+                start -= left + 1
+                node = node.right
+        while stack:
+            node = stack.pop()
+            yield node.track
+            node = node.right
+            while node is not None:
+                stack.append(node)
+                node = node.left
+
+    def append(self, track):
+        """Adds a song to the end of the queue
+
+        Args:
+            track (Track): The song to add
+        """
+        self._root = _merge(self._root, _Node(track))
+
+    def extend(self, tracks):
+        """Adds songs to the end of the queue
+
+        Args:
+            tracks (iterable): The songs to add
+        """
+        self._root = _merge(self._root, _build(tracks))
+
+    def insert(self, index, track):
+        """Adds a song before a position
+
+        Args:
+            index (int): The position the song will have
+            track (Track): The song to add
+        """
+        left, right = _split(self._root, max(0, min(index, len(self))))
+        self._root = _merge(_merge(left, _Node(track)), right)
+
+    def pop(self, index=0):
+        """Removes the song at a position
+
+        Args:
+            index (int, optional): The position of the song, the front of the queue by default
+
+        Returns:
+            Track: The removed song
+        """
+        index = self._position(index)
+        left, rest = _split(self._root, index)
+        node, right = _split(rest, 1)
+        self._root = _merge(left, right)
+        return node.track
+
+    def remove_range(self, start, stop):
+        """Removes the songs in a range of positions
+
+        Args:
+            start (int): The position of the first song to remove
+            stop (int): The position after the last song to remove
+
+        Returns:
+            list: The removed songs
+        """
+        left, rest = _split(self._root, start)
+        middle, right = _split(rest, max(0, stop - start))
+        self._root = _merge(left, right)
+        return list(TrackQueue._wrap(middle))
+
+    def move(self, source, destination):
+        """Moves a song to another position
+
+        Args:
+            source (int): The position of the song
+            destination (int): The position the song will have
+        """
+        self.insert(destination, self.pop(source))
+
+    def shuffle(self, start=0):
+        """Shuffles the songs from a position onwards
+
+        Args:
+            start (int, optional): The position of the first song to shuffle
+        """
+        left, right = _split(self._root, start)
+        tracks = list(TrackQueue._wrap(right))
+        random.shuffle(tracks)
+        self._root = _merge(left, _build(tracks))
+
+    def clear(self):
+        """Removes every song
+        """
+        self._root = None
+
+    @staticmethod
+    def _wrap(root):
+        """Makes a queue of a detached tree so it can be walked
+
+        Args:
+            root (_Node): The root of the tree
+
+        Returns:
+            TrackQueue: The queue holding the tree
+        """
+        queue = TrackQueue()
+        queue._root = root
+        return queue
@@ -0,0 +1,184 @@
+"""Fills the Music cog's audio cache ahead of time, so the first play of every listed song starts at once
+
+Usage: python warm_cache.py <list file> [--workers N] [--progress FILE]
+
+Each line of the list file is a song url, a playlist url or search terms, lines starting with # are
+skipped. A song url that is also part of a playlist only warms the song, unless the line ends with -a
+as in the bot's play command. Songs are looked up and downloaded in worker processes into the cache
+directory set in music.json, with their information added to the metadata cache, so a running bot
+picks them up the next time they are played. Finished lines are recorded in the progress file, and
+running the tool again carries on from where it stopped.
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import youtube_dl
+
+import bot_util as bt
+from Music import download_audio, get_song_info, pick_result, playlist_ydl_opts, song_meta_keys
+from music_settings import load_settings
+from song_cache import MetadataCache, find_stored, write_json
+
+video_url = 'https://www.youtube.com/watch?v='
+
+
+def read_list(file):
+    """Reads the songs to warm from a list file
+
+    Args:
+        file (str): The path of the list file
+
+    Returns:
+        list: The url or search terms on each line
+    """
+    with open(file, 'r') as f:
+        lines = [line.strip() for line in f]
+    return [line for line in lines if line and not line.startswith('#')]
+
+
+def expand_playlist(url, limit):
+    """Lists the song urls of a playlist
+
+    Args:
+        url (str): The url of the playlist
+        limit (int): The number of songs read from the playlist
+
+    Returns:
+        list: The url of each song
+    """
+    with youtube_dl.YoutubeDL(dict(playlist_ydl_opts, playlistend=limit)) as ydl:
+        info = ydl.extract_info(url, download=False)
+    return [video_url + entry['id'] for entry in info.get('entries') or [] if entry and entry.get('id')]
+
+
+def warm(item, directory, opus, timeout):
+    """Looks up and downloads a song into the cache directory, this runs in a worker process
+
+    Args:
+        item (str): The url or search terms of the song
+        directory (str): The cache directory
+        opus (bool): If the native Opus stream is preferred
+        timeout (float): The number of seconds youtube_dl waits on YouTube
+
+    Returns:
+        tuple: tuple containing:
+                str: the url the song was looked up with
+                dict: the information of the song to store in the metadata cache
+                bool: if the song was downloaded, False if it was already cached
+    """
+    url = item
+    if not item.startswith('http'):
+        result = pick_result(bt.YoutubeSearch(item, max_results=10).to_dict())
+        if result is None:
+            raise LookupError(f'Nothing useful found for {item}')
+        url = 'https://youtube.com' + result['link']
+    info = get_song_info(url, timeout=timeout)
+    info = {key: info.get(key) for key in song_meta_keys + MetadataCache.format_keys}
+    if find_stored(directory, info['id']) is not None:
+        return url, info, False
+    partial = os.path.join(directory, '.warming', f'{info["id"]}.{os.getpid()}')
+    download = download_audio(url, partial, opus=opus)
+    os.replace(download, os.path.join(directory, info['id'] + os.path.splitext(download)[1]))
+    return url, info, True
+
+
+def read_progress(file):
+    """Reads the progress file left by an earlier run
+
+    Args:
+        file (str): The path of the progress file
+
+    Returns:
+        dict: The result of each item done, empty if there is no progress file yet
+    """
+    if not os.path.isfile(file):
+        return {}
+    try:
+        with open(file, 'r') as f:
+            return json.load(f)
+    except Exception:
+        ex_type, ex_value, ex_traceback = sys.exc_info()
+        bt.ERROR(f'Unable to read the progress file {file}, starting over: {ex_value}')
+        return {}
+
+
+def run(items, settings, progress_file, workers):
+    """Warms every item that the progress file does not record as done
+
+    Args:
+        items (list): The urls and search terms to warm
+        settings (MusicSettings): The settings of the Music extension
+        progress_file (str): The json file recording the items done
+        workers (int): The number of worker processes
+
+    Returns:
+        int: The number of items that failed
+    """
+    progress = read_progress(progress_file)
+    # dict with structure as : item: {'id': video id} once done, {'songs': [urls]} for playlists or {'error': message}
+    songs = []
+    for item in items:
+        url = item[:-len(' -a')].strip() if item.endswith(' -a') else item
+        if url != item or (url.startswith('http') and 'list=' in url and bt.get_video_id(url) is None):
+            if 'songs' not in progress.get(item, {}):
+                try:
+                    progress[item] = {'songs': expand_playlist(url, settings.playlist_limit)}
+                except Exception:
+                    ex_type, ex_value, ex_traceback = sys.exc_info()
+                    bt.ERROR(f'Unable to read the playlist {item}: {ex_value}')
+                    progress[item] = {'error': str(ex_value)}
+                    continue
+            songs.extend(progress[item]['songs'])
+        else:
+            songs.append(item)
+    songs = [song for song in dict.fromkeys(songs) if 'id' not in progress.get(song, {})]
+    bt.INFO(f'Warming {len(songs)} songs from {len(items)} lines')
+
+    directory = settings.cache_directory
+    os.makedirs(os.path.join(directory, '.warming'), exist_ok=True)
+    metadata = MetadataCache(os.path.join(directory, 'metadata.json'), ttl=settings.metadata_ttl)
+    start = time.monotonic()
+    downloaded = failed = 0
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(warm, item, directory, settings.opus_passthrough, settings.extract_timeout): item
+                   for item in songs}
+        for done, future in enumerate(as_completed(futures), 1):
+            item = futures[future]
+            try:
+                url, info, fresh = future.result()
+            except Exception:
+                ex_type, ex_value, ex_traceback = sys.exc_info()
+                bt.ERROR(f'[{done}/{len(songs)}] Unable to warm {item}: {ex_value}')
+                progress[item] = {'error': str(ex_value)}
+                failed += 1
+            else:
+                metadata.put(url, info, song_meta_keys)
+                metadata.save()
+                progress[item] = {'id': info['id']}
+                downloaded += fresh
+                bt.INFO(f'[{done}/{len(songs)}] {"Downloaded" if fresh else "Already cached"}: {info["title"]}')
+            write_json(progress_file, progress)
+    shutil.rmtree(os.path.join(directory, '.warming'), ignore_errors=True)
+    bt.INFO(f'Warmed {len(songs) - failed} songs in {time.monotonic() - start:.0f}s, {downloaded} downloaded, '
+            f'{failed} failed')
+    return failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Pre-download songs into the Music cog\'s audio cache')
+    parser.add_argument('list', help='a file with a url, playlist url or search terms on each line')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 2, help='the number of worker processes')
+    parser.add_argument('--progress', help='the progress file, <list>.progress.json by default')
+    args = parser.parse_args()
+    failed = run(read_list(args.list), load_settings(), args.progress or args.list + '.progress.json',
+                 max(1, args.workers))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()